@@ -0,0 +1,90 @@
+# aggregation.py
+"""
+Agregação colunar por distrito.
+
+Substitui os `groupby().apply(lambda g: pd.Series({...}))` do ETL por reduções
+nativas do pandas (uma passada por coluna, sem objeto Python por grupo).
+Novos indicadores entram declarando uma linha em FLAGS/INDICATORS.
+"""
+import numpy as np
+import pandas as pd
+
+KEYS = ["bairro_id", "bairro_name"]
+
+# flags por escola: (coluna gerada, coluna de origem, padrão, regex?, upper?)
+FLAGS = [
+    ("is_municipal", "rede",  "municipal", False, False),
+    ("is_estadual",  "rede",  "estadual",  False, False),
+    ("is_privada",   "rede",  "privada",   False, False),
+    ("is_ei_creche", "etapa", "CRECHE|INFANTIL|EDUCAÇÃO INFANTIL", True, True),
+]
+
+# indicadores por distrito: (coluna de saída, coluna de entrada, redução)
+# redução = qualquer agregação nativa do groupby ("size", "sum", "mean", "max", ...)
+INDICATORS = [
+    ("schools_total",       "id_escola",    "size"),
+    ("schools_municipal",   "is_municipal", "sum"),
+    ("schools_estadual",    "is_estadual",  "sum"),
+    ("schools_privada",     "is_privada",   "sum"),
+    ("acesso_creche_proxy", "is_ei_creche", "mean"),
+]
+
+# IDEB por escola -> distrito (só quando houver id_escola no IDEB)
+IDEB_INDICATORS = [
+    ("ideb",      "ideb",      "mean"),
+    ("ideb_year", "ideb_year", "max"),
+]
+
+def add_flags(joined: pd.DataFrame, flags=FLAGS) -> pd.DataFrame:
+    """Cria as colunas booleanas de FLAGS (coluna de origem ausente => tudo False)."""
+    for name, src, pat, regex, upper in flags:
+        if src not in joined.columns:
+            joined[name] = False
+            continue
+        col = joined[src]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            # avalia o padrão só nas categorias (+ "nan" p/ código -1) e expande pelos códigos
+            cats = pd.Series(list(col.cat.categories.astype(str)) + ["nan"])
+            cats = cats.str.upper() if upper else cats.str.lower()
+            hit = cats.str.contains(pat, regex=regex, na=False).to_numpy()
+            joined[name] = hit[col.cat.codes.to_numpy()]
+            continue
+        s = col.astype(str)
+        s = s.str.upper() if upper else s.str.lower()
+        joined[name] = s.str.contains(pat, regex=regex, na=False)
+    return joined
+
+def _reduce(df: pd.DataFrame, indicators) -> pd.DataFrame:
+    grp = df.groupby(KEYS, dropna=False, sort=True)
+    named = {}
+    for out, col, how in indicators:
+        named[out] = pd.NamedAgg(column=col, aggfunc=how)
+    return grp.agg(**named).reset_index()
+
+def aggregate_schools(joined: pd.DataFrame, indicators=INDICATORS) -> pd.DataFrame:
+    """Contagens/proporções por distrito (INDICATORS); contagens em float64 como no agg.parquet histórico."""
+    agg = _reduce(joined, indicators)
+    for out, _, _ in indicators:
+        agg[out] = agg[out].astype("float64")
+    return agg
+
+def merge_ideb(agg: pd.DataFrame, joined: pd.DataFrame, ideb_df=None, ideb_indicators=IDEB_INDICATORS) -> pd.DataFrame:
+    """Acrescenta ideb/ideb_year por distrito (NaN/NA quando não houver IDEB por escola)."""
+    if ideb_df is not None and "id_escola" in ideb_df.columns and ideb_df["id_escola"].notna().any():
+        df = joined[KEYS + ["id_escola"]].merge(ideb_df[["id_escola", "ideb", "ideb_year"]], on="id_escola", how="left")
+        ideb_agg = _reduce(df, ideb_indicators)
+        ideb_agg["ideb_year"] = ideb_agg["ideb_year"].astype(object).where(ideb_agg["ideb_year"].notna(), pd.NA)
+        return agg.merge(ideb_agg, on=KEYS, how="left")
+    agg = agg.copy()
+    agg["ideb"] = np.nan
+    agg["ideb_year"] = pd.NA
+    return agg
+
+def aggregate_districts(joined: pd.DataFrame, ideb_df=None,
+                        indicators=INDICATORS, ideb_indicators=IDEB_INDICATORS) -> pd.DataFrame:
+    """
+    Agrega escolas (já com bairro_id/bairro_name e flags) por distrito.
+    Mantém o schema histórico de agg.parquet: contagens em float64 e
+    ideb/ideb_year sempre presentes (NaN/NA quando não houver IDEB por escola).
+    """
+    return merge_ideb(aggregate_schools(joined, indicators), joined, ideb_df, ideb_indicators)
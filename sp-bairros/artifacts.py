@@ -0,0 +1,47 @@
+# artifacts.py
+"""
+Artefatos colunares trocados entre os estágios (ETL -> ranking -> build).
+
+norm_features.parquet: uma linha por distrito com `id`, `name` e uma coluna
+float64 por feature normalizada (mesmo conteúdo do norm_for_llm.json, sem o
+round-trip de JSON). O JSON continua sendo gerado para o prompt do LLM.
+"""
+import os, json
+import pandas as pd
+
+ID_COLS = ["id", "name"]
+
+def norm_frame(ids, names, N: pd.DataFrame) -> pd.DataFrame:
+    """DataFrame canônico (id str, name, features float64) a partir da matriz N do ETL."""
+    df = N.reset_index(drop=True).astype("float64")
+    df.insert(0, "name", pd.Series(names).reset_index(drop=True).astype(object))
+    df.insert(0, "id", pd.Series(ids).reset_index(drop=True).astype(str).astype(object))
+    return df
+
+def norm_items(df: pd.DataFrame) -> list:
+    """Lista [{'id','name','norm':{...}}] (formato do norm_for_llm.json) sem iterrows."""
+    feats = feature_cols(df)
+    vals = df[feats].to_numpy(dtype="float64").tolist()
+    return [{"id": i, "name": n, "norm": dict(zip(feats, v))}
+            for i, n, v in zip(df["id"].tolist(), df["name"].tolist(), vals)]
+
+def feature_cols(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if c not in ID_COLS]
+
+def write_norm(df: pd.DataFrame, parquet_path, json_path=None):
+    """Grava o Parquet (e, se pedido, o JSON do LLM) a partir do mesmo DataFrame."""
+    os.makedirs(os.path.dirname(parquet_path) or ".", exist_ok=True)
+    df.to_parquet(parquet_path, engine="pyarrow", index=False)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"distritos": norm_items(df)}, f, ensure_ascii=False, indent=2)
+
+def read_norm(parquet_path=None, json_path=None) -> pd.DataFrame:
+    """Lê as features normalizadas: Parquet se existir; senão o JSON do LLM (artefatos antigos)."""
+    if parquet_path and os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path, engine="pyarrow")
+    items = json.load(open(json_path, "r", encoding="utf-8")).get("distritos", [])
+    df = pd.json_normalize(items) if items else pd.DataFrame(columns=ID_COLS)
+    df.columns = [c[len("norm."):] if c.startswith("norm.") else c for c in df.columns]
+    df["id"] = df["id"].astype(str)
+    return df[ID_COLS + [c for c in df.columns if c not in ID_COLS]]
@@ -0,0 +1,108 @@
+# bench_ranking.py
+"""
+Benchmark do estágio de ranking contra o mock local do Ollama (sem GPU).
+
+Para cada combinação de nº de distritos × batch_size × workers roda
+ranking.run_ranking() com o LLM apontado para mock_ollama e mede:
+  wall_s     — tempo de parede do ranking
+  requests   — requisições recebidas pelo mock
+  retries    — requisições além de 1 por lote
+  fallback   — fração de distritos que ficou no score determinístico
+  violations — respostas fora do contrato (contract.py)
+Distritos além dos reais são sintetizados reamostrando o norm com ruído.
+
+Uso:
+    python bench_ranking.py --sizes 96,500 --batch 0,50 --workers 1,4 --latency 0.1 --tps 3000 --fail short=0.1
+Resultado em out/bench_ranking.json (e tabela no terminal).
+"""
+import io, os, json, time, argparse, contextlib
+import numpy as np
+import pandas as pd
+
+import ranking
+from artifacts import feature_cols, norm_items, read_norm
+from contract import ContractStats
+from mock_ollama import MockConfig, parse_fail, start
+
+def synth_norm(base: pd.DataFrame, n: int, seed=0) -> pd.DataFrame:
+    """n distritos: os reais primeiro; o resto reamostrado com ruído (ids 'b<i>')."""
+    if n <= len(base):
+        return base.iloc[:n].reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    extra = base.iloc[rng.integers(0, len(base), n - len(base))].reset_index(drop=True).copy()
+    feats = feature_cols(base)
+    extra[feats] = (extra[feats] + rng.normal(0, 0.05, (len(extra), len(feats)))).clip(0, 1)
+    extra["id"] = [f"b{i}" for i in range(len(extra))]
+    extra["name"] = [f"sintético {i}" for i in range(len(extra))]
+    return pd.concat([base, extra], ignore_index=True)
+
+def n_batches(norm_df, batch_size, n_anchors) -> int:
+    n = len(norm_df)
+    if not batch_size or batch_size >= n:
+        return 1
+    items = norm_items(norm_df)
+    return len(ranking.split_batches(items, batch_size, items[:min(n_anchors, n)]))
+
+def run_case(norm_df, url, mock, batch_size, workers, timeout, verbose=False) -> dict:
+    ranking.LLM.update({"url": url, "batch_size": batch_size, "workers": workers, "timeout": timeout})
+    ranking.CACHE = None
+    ranking.CONTRACT = ContractStats()
+    r0 = mock.requests
+    sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    t0 = time.perf_counter()
+    with sink:
+        result, scored, _ = ranking.run_ranking(norm_df)
+    wall = time.perf_counter() - t0
+    reqs = mock.requests - r0
+    batches = n_batches(norm_df, batch_size, int(ranking.LLM.get("anchors", 3)))
+    fb = 1.0 if scored is None else float((scored["source"] == "deterministic").mean())
+    return {"n": len(norm_df), "batch_size": batch_size, "workers": workers, "wall_s": round(wall, 3),
+            "requests": reqs, "batches": batches, "retries": max(0, reqs - batches),
+            "fallback": round(fb, 4), "violations": ranking.CONTRACT.violations,
+            "items": len(result["ranking"])}
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do ranking.py contra o mock do Ollama.")
+    ap.add_argument("--sizes", default="96,400", help="nº de distritos, separados por vírgula")
+    ap.add_argument("--batch", default="0,50", help="llm.batch_size a testar (0 = requisição única)")
+    ap.add_argument("--workers", default="1,4", help="llm.workers a testar")
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--tps", type=float, default=4000.0)
+    ap.add_argument("--fail", default="", help="modos de falha do mock (ver mock_ollama.py)")
+    ap.add_argument("--hang", type=float, default=3.0, help="s parado no modo timeout do mock")
+    ap.add_argument("--timeout", type=float, default=2.0, help="llm.timeout durante o benchmark")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="out/bench_ranking.json")
+    ap.add_argument("-v", "--verbose", action="store_true", help="mostra o log do ranking")
+    a = ap.parse_args()
+
+    mock = MockConfig(a.latency, a.tps, parse_fail(a.fail), a.hang, seed=a.seed)
+    srv, url = start(mock)
+    base = read_norm(ranking.IN_NORM_PQ, ranking.IN_NORM)
+    print(f"[bench] mock em {url} (latência {a.latency}s, {a.tps or '∞'} tok/s, falhas {mock.fail or '-'})")
+
+    rows = []
+    try:
+        for n in map(int, a.sizes.split(",")):
+            norm_df = synth_norm(base, n, a.seed)
+            for bs in map(int, a.batch.split(",")):
+                for w in map(int, a.workers.split(",")):
+                    if not bs and w > 1:
+                        continue           # requisição única: workers não muda nada
+                    r = run_case(norm_df, url, mock, bs, w, a.timeout, a.verbose)
+                    rows.append(r)
+                    print(f"[bench] n={r['n']:>5} batch={bs:>4} workers={w:>2}: {r['wall_s']:7.2f}s  "
+                          f"{r['requests']:>3} req ({r['retries']} retry)  fallback {r['fallback']:.1%}  "
+                          f"violações {r['violations']}")
+    finally:
+        srv.shutdown()
+
+    os.makedirs(os.path.dirname(a.out) or ".", exist_ok=True)
+    with open(a.out, "w", encoding="utf-8") as f:
+        json.dump({"mock": {"latency": a.latency, "tps": a.tps, "fail": mock.fail, "seed": a.seed,
+                            "failures": mock.failures},
+                   "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": rows}, f, ensure_ascii=False, indent=2)
+    print(f"[bench] resultados: {a.out}")
+
+if __name__ == "__main__":
+    main()
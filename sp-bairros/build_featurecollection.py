@@ -1,163 +1,151 @@
-import re, json, yaml
+import os, json, yaml, hashlib
 import pandas as pd
 import numpy as np
 import geopandas as gpd
-from shapely.geometry import mapping
 
-cfg = yaml.safe_load(open("config.yaml","r", encoding="utf-8"))
+from artifacts import feature_cols, read_norm
+from fc_writer import dumps, geometry_json, write_attribute_table, write_feature_collection
+from geostore import load_districts
+from lod import build_lods, lod_path, parse_lods
+
+CONFIG = os.environ.get("SP_CONFIG", "config.yaml")   # pipeline.py --config repassa o caminho
+cfg = yaml.safe_load(open(CONFIG, "r", encoding="utf-8"))
 IN_DIST   = cfg["inputs"]["distritos_geojson"]
 OUT_NORM  = cfg["outputs"]["norm_json"]         # out/norm_for_llm.json
+OUT_NORM_PQ = cfg["outputs"].get("norm_parquet")  # out/norm_features.parquet
 OUT_RANK  = cfg["outputs"]["rank_json"]         # out/llm_ranking.json
 OUT_AGG   = cfg.get("outputs", {}).get("agg_parquet")  # opcional (p/ ngc)
 OUT_FC    = cfg["outputs"]["final_geojson"]
+OUT_GEOM  = cfg["outputs"].get("geom_geojson")    # só geometria + id (muda raramente)
+OUT_ATTRS = cfg["outputs"].get("attrs_json")      # tabela de atributos por id (muda a cada ranking)
+GEO_STORE = cfg["outputs"].get("geo_store")
+BUILD     = cfg.get("build") or {}
 
-# ---------- utils ----------
-def clean_id(v: object) -> str:
-    s = str(v)
-    s = re.sub(r"\.0+$", "", s)       # remove sufixo .0
-    s = re.sub(r"\s+", "", s).strip()
-    return s
+N_KEYS = ["marginalidade","schools_total_bad","share_municipal_bad","share_estadual_bad","acesso_creche_bad"]
+RANK_KEYS = ["llm_score","rank_sp","tier","drivers","explanation"]
 
-def extract_digits(s: str) -> str:
-    """Extrai os dígitos (último bloco) de um id com prefixo ex.: 'distrito_municipal_v2.8583462' -> '8583462'."""
-    m = re.search(r'(\d+)\s*$', str(s))
-    return m.group(1) if m else clean_id(s)
+# ---------- utils ----------
+def clean_ids(s: pd.Series) -> pd.Series:
+    """Id só com o último bloco de dígitos ('distrito_municipal_v2.8583462' / 8583462.0 -> '8583462'), sem espaços."""
+    c = s.astype(str).str.replace(r"\.0+$", "", regex=True).str.replace(r"\s+", "", regex=True)
+    return c.str.extract(r"(\d+)\s*$")[0].fillna(c)
 
 def load_distritos(fp: str) -> gpd.GeoDataFrame:
-    g = gpd.read_file(fp)
-    if g.crs is None:
-        g = g.set_crs(31983)  # SIRGAS 2000 / UTM 23S (troque p/ 31984 se necessário)
-    try:
-        g = g.to_crs(4326)
-    except Exception:
-        pass
-
-    cols_low = {c.lower(): c for c in g.columns}
-
-    # name (prioriza nm_distrito_municipal)
-    if "nm_distrito_municipal" in cols_low:
-        g["name"] = g[cols_low["nm_distrito_municipal"]].astype(str).str.strip()
-    elif "name" in g.columns:
-        g["name"] = g["name"].astype(str).str.strip()
-    else:
-        for cand in ["nome_dist","distritos","distrito","nome","nome_distrito"]:
-            if cand in cols_low:
-                g["name"] = g[cols_low[cand]].astype(str).str.strip()
-                break
-        if "name" not in g.columns:
-            g["name"] = [f"distrito_{i}" for i in range(len(g))]
-
-    # id (prioriza cd_identificador_distrito, depois cd_distrito_municipal)
-    if "cd_identificador_distrito" in cols_low:
-        g["id"] = g[cols_low["cd_identificador_distrito"]].apply(clean_id)
-    elif "cd_distrito_municipal" in cols_low:
-        g["id"] = g[cols_low["cd_distrito_municipal"]].apply(clean_id)
-    else:
-        # se já existir 'id' com prefixo, extrai os dígitos
-        if "id" in g.columns:
-            g["id"] = g["id"].apply(extract_digits)
-        else:
-            # tenta última alternativa: extrair dígitos de qualquer coluna típica
-            base_id = None
-            for cand in ["codigo","id_distrito"]:
-                if cand in cols_low:
-                    base_id = cols_low[cand]; break
-            if base_id:
-                g["id"] = g[base_id].apply(clean_id)
-            else:
-                g["id"] = [f"{i}" for i in range(len(g))]
-
-    # normaliza id
-    g["id"] = g["id"].astype(str).apply(extract_digits)
-
+    """Distritos do store de geometrias (geostore.py): mesmos id/name/CRS que o ETL usa."""
+    g = load_districts(fp, store=GEO_STORE, assume_crs=cfg["inputs"].get("distritos_crs", 31983))
     return g[["id","name","geometry"]].copy()
 
-# ---------- carregar distritos ----------
-g = load_distritos(IN_DIST)
-
-# ---------- carregar NORM ----------
-norm_payload = json.load(open(OUT_NORM, "r", encoding="utf-8"))
-norm_by_id = {}
-for it in norm_payload.get("distritos", []):
-    nid_raw = it.get("id")
-    nid = extract_digits(clean_id(nid_raw))
-    norm_by_id[nid] = it.get("norm", {})
-
-N_KEYS = ["marginalidade","schools_total_bad","share_municipal_bad","share_estadual_bad","acesso_creche_bad"]
-
-# ---------- carregar RANK ----------
-rank_payload = json.load(open(OUT_RANK,"r",encoding="utf-8"))
-rank_by_id = {}
-for r in rank_payload.get("ranking", []):
-    rid = extract_digits(clean_id(r.get("id")))
-    rank_by_id[rid] = {
-        "llm_score": r.get("llm_score", None),
-        "rank_sp":   r.get("rank", None),
-        "tier":      r.get("tier", None),
-        "drivers":   r.get("drivers", None),
-        "explanation": r.get("explanation", None),
-    }
-
-# ---------- (opcional) ngc ----------
-ngc_by_id = {}
-if OUT_AGG:
+# ---------- tabelas (uma linha por id normalizado) ----------
+def norm_table() -> pd.DataFrame:
+    # Parquet colunar do ETL (JSON só se o Parquet não existir)
+    norm_df = read_norm(OUT_NORM_PQ, OUT_NORM)
+    keys = [k for k in N_KEYS if k in feature_cols(norm_df)]
+    t = norm_df[keys].apply(pd.to_numeric, errors="coerce").astype("float64")
+    t.insert(0, "id", clean_ids(norm_df["id"]).to_numpy())
+    return t.drop_duplicates("id", keep="last")
+
+def rank_table() -> pd.DataFrame:
+    rank_payload = json.load(open(OUT_RANK,"r",encoding="utf-8"))
+    r = pd.DataFrame(rank_payload.get("ranking", []))
+    if r.empty:
+        return pd.DataFrame(columns=["id"] + RANK_KEYS)
+    r = r.rename(columns={"rank": "rank_sp"}).reindex(columns=["id"] + RANK_KEYS)
+    r["id"] = clean_ids(r["id"]).to_numpy()
+    r["llm_score"] = pd.to_numeric(r["llm_score"], errors="coerce")
+    r["rank_sp"] = pd.to_numeric(r["rank_sp"], errors="coerce").astype("Int64")
+    return r.drop_duplicates("id", keep="last")
+
+def ngc_table() -> pd.DataFrame:
+    if OUT_AGG:
+        try:
+            adf = pd.read_parquet(OUT_AGG, columns=["bairro_id", "ngc"])
+            return pd.DataFrame({"id": clean_ids(adf["bairro_id"]).to_numpy(),
+                                 "ngc": pd.to_numeric(adf["ngc"], errors="coerce")}).drop_duplicates("id", keep="last")
+        except Exception:
+            pass
+    return pd.DataFrame({"id": pd.Series(dtype=object), "ngc": pd.Series(dtype="float64")})
+
+def properties(g: gpd.GeoDataFrame) -> pd.DataFrame:
+    """Properties de cada distrito via merges (mesma ordem de g)."""
+    p = pd.DataFrame({"id": clean_ids(g["id"]).to_numpy(),    # 'id' já normalizado (numérico em string)
+                      "name": g["name"].to_numpy(), "level": "distrito", "uf": "SP"})
+    for t in (norm_table(), rank_table(), ngc_table()):
+        p = p.merge(t, on="id", how="left")
+    return p
+
+def _present(v) -> bool:
+    """Valor entra nas properties? (NaN/None/'' ficam de fora)"""
+    if v is None or v is pd.NA:
+        return False
+    if isinstance(v, float):
+        return not np.isnan(v)
+    return not (isinstance(v, str) and v == "")
+
+def properties_json(p: pd.DataFrame) -> list:
+    """Uma string JSON minificada por linha, omitindo chaves ausentes (como o builder original)."""
+    cols = [c for c in ["id","name","level","uf"] + N_KEYS + RANK_KEYS + ["ngc"] if c in p.columns]
+    arrays = []
+    for c in cols:
+        s = p[c]
+        if c == "rank_sp":
+            arrays.append([None if v is pd.NA else int(v) for v in s.tolist()])
+        else:
+            arrays.append(s.tolist())
+    return [dumps({k: v for k, v in zip(cols, row) if _present(v)}) for row in zip(*arrays)]
+
+def _sizes(sizes: dict) -> str:
+    return ", ".join(f"{p} {n/1e6:.2f} MB" for p, n in sizes.items())
+
+def write_geometry(path, ids, geoms_json, enc: dict) -> bool:
+    """
+    FeatureCollection só de geometria ("id" + properties {"id"}). Se ids/geometrias/codificação
+    não mudaram desde o último build, não regrava (arquivo, mtime e ETag continuam os mesmos).
+    """
+    h = hashlib.sha256(json.dumps([ids, enc], sort_keys=True).encode("utf-8"))
+    for gj in geoms_json:
+        h.update(gj.encode("utf-8"))
+    side = path + ".sha256"
     try:
-        adf = pd.read_parquet(OUT_AGG)
-        if "bairro_id" in adf.columns and "ngc" in adf.columns:
-            adf = adf.copy()
-            adf["bairro_id"] = adf["bairro_id"].apply(lambda x: extract_digits(clean_id(x)))
-            ngc_by_id = dict(zip(adf["bairro_id"], adf["ngc"]))
-    except Exception:
+        prev = json.load(open(side, "r", encoding="utf-8"))
+        if prev.get("digest") == h.hexdigest() and all(os.path.exists(p) for p in prev.get("files", [])):
+            print(f"[ok] geometria inalterada → {path}")
+            return False
+    except (OSError, ValueError):
         pass
-
-# ---------- montar FeatureCollection ----------
-features = []
-for _, row in g.iterrows():
-    gid_num = extract_digits(row["id"])  # garante que casa com norm/rank
-    props = {
-        "id": gid_num,       # entregamos 'id' já normalizado (numérico em string)
-        "name": row["name"],
-        "level": "distrito",
-        "uf": "SP",
-    }
-
-    # N.*
-    norm = norm_by_id.get(gid_num, {})
-    for k in N_KEYS:
-        if k in norm:
-            try:
-                fval = float(norm[k])
-                if not np.isnan(fval):
-                    props[k] = float(fval)
-            except Exception:
-                pass
-
-    # ranking
-    if gid_num in rank_by_id:
-        rinfo = rank_by_id[gid_num]
-        if rinfo.get("llm_score") is not None:
-            try: props["llm_score"] = float(rinfo["llm_score"])
-            except: pass
-        if rinfo.get("rank_sp") is not None:
-            try: props["rank_sp"] = int(rinfo["rank_sp"])
-            except: pass
-        if rinfo.get("tier") not in (None, "", np.nan): props["tier"] = rinfo["tier"]
-        if rinfo.get("drivers") not in (None, "", np.nan): props["drivers"] = rinfo["drivers"]
-        if rinfo.get("explanation") not in (None, "", np.nan): props["explanation"] = rinfo["explanation"]
-
-    # ngc (se houver)
-    if gid_num in ngc_by_id and pd.notna(ngc_by_id[gid_num]):
-        try: props["ngc"] = float(ngc_by_id[gid_num])
-        except: pass
-
-    features.append({
-        "type":"Feature",
-        "geometry": mapping(row["geometry"]) if row["geometry"] is not None else None,
-        "properties": props
-    })
-
-fc = {"type":"FeatureCollection","features": features}
-with open(OUT_FC,"w",encoding="utf-8") as f:
-    json.dump(fc, f, ensure_ascii=False, indent=2)
-
-print(f"[ok] FeatureCollection (norm + ranking + ngc) → {OUT_FC} | distritos: {len(features)}")
+    sizes = write_feature_collection(path, [dumps({"id": i}) for i in ids], geoms_json, ids=ids, **enc)
+    with open(side, "w", encoding="utf-8") as f:
+        json.dump({"digest": h.hexdigest(), "files": list(sizes)}, f)
+    print(f"[ok] geometria → {_sizes(sizes)}")
+    return True
+
+def main():
+    g = load_distritos(IN_DIST)
+    p = properties(g)
+    props, ids = properties_json(p), p["id"].tolist()
+    enc = {"precompress": list(BUILD.get("precompress", ["br", "gzip"])),
+           "brotli_quality": int(BUILD.get("brotli_quality", 11)),
+           "gzip_level": int(BUILD.get("gzip_level", 9)),
+           "zstd_level": int(BUILD.get("zstd_level", 19))}
+    sizes = write_feature_collection(OUT_FC, props, geometry_json(g.geometry.values), **enc)
+    print(f"[ok] FeatureCollection (norm + ranking + ngc) → {OUT_FC} | distritos: {len(props)} | {_sizes(sizes)}")
+
+    # LODs: mesmas properties, geometria simplificada (cobertura) + coordenadas quantizadas
+    lods = build_lods(g, parse_lods(BUILD.get("lods")), gap_m=float(BUILD.get("coverage_gap_m", 10)))
+    lod_geoms = {name: geometry_json(geoms) for name, geoms in lods.items()}
+    for name, geoms_json in lod_geoms.items():
+        path = lod_path(OUT_FC, name)
+        sizes = write_feature_collection(path, props, geoms_json, **enc)
+        print(f"[ok] LOD {name} → {path} | {sizes[path]/1e6:.2f} MB"
+              + "".join(f", {p} {n/1e6:.2f} MB" for p, n in sizes.items() if p != path))
+
+    # geometria e atributos separados: ranking novo só troca a tabela (poucos KB)
+    if OUT_GEOM:
+        write_geometry(OUT_GEOM, ids, geometry_json(g.geometry.values), enc)
+        for name, geoms_json in lod_geoms.items():
+            write_geometry(lod_path(OUT_GEOM, name), ids, geoms_json, enc)
+    if OUT_ATTRS:
+        sizes = write_attribute_table(OUT_ATTRS, ids, props, **enc)
+        print(f"[ok] atributos por id → {_sizes(sizes)}")
+
+if __name__ == "__main__":
+    main()
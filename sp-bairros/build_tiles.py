@@ -0,0 +1,126 @@
+# build_tiles.py
+"""
+Pirâmide de Mapbox Vector Tiles dos distritos num único arquivo MBTiles.
+
+Para cada zoom de tiles.zoom_min..zoom_max:
+  - simplifica a cobertura de distritos (lod.py) com tolerância de
+    `simplify_px` pixels naquele zoom — vizinhos continuam colados;
+  - recorta cada tile (com buffer) e codifica a camada (mvt.py) só com os
+    campos do coroplético (tiles.fields; o id do distrito vai no id da feature);
+  - grava o tile em gzip (convenção do MBTiles para pbf).
+Tiles sem nenhum distrito não entram no arquivo.
+
+O MBTiles (SQLite) é gravado em .tmp e trocado atomicamente; o server.py
+entrega os tiles direto dele em /tiles/{z}/{x}/{y}.mvt.
+
+Uso:
+    python build_tiles.py
+"""
+import os, json, gzip, time, sqlite3, tempfile
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+from build_featurecollection import cfg, IN_DIST, clean_ids, load_distritos, rank_table
+from lod import clean_coverage
+from mvt import encode_tile, ground_resolution, tile_bounds, tile_coords, tile_range
+
+TILES    = cfg.get("tiles") or {}
+OUT_MBT  = cfg["outputs"].get("tiles_mbtiles", "out/distritos.mbtiles")
+GAP_M    = float((cfg.get("build") or {}).get("coverage_gap_m", 10))
+
+def attributes(g: gpd.GeoDataFrame, fields) -> list:
+    """Properties de cada distrito (mesma ordem de g), só com os campos pedidos."""
+    ids = clean_ids(g["id"])
+    r = rank_table().set_index("id")
+    cols = [c for c in fields if c in r.columns]
+    t = r.reindex(ids.to_numpy())[cols]
+    return [{k: (int(v) if k == "rank_sp" else v) for k, v in rec.items() if not pd.isna(v)}
+            for rec in t.to_dict("records")]
+
+def feature_ids(g: gpd.GeoDataFrame) -> list:
+    ids = clean_ids(g["id"])
+    return [int(i) if i.isdigit() else None for i in ids.tolist()]
+
+def write_mbtiles(path, tiles, metadata: dict):
+    """
+    Grava {(z, x, y): bytes gzip} + metadata num MBTiles novo: tmp único (mkstemp, como
+    ingest.write_cache) + os.replace, então rebuilds concorrentes não pisam no tmp um do outro.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        _fill_mbtiles(tmp, tiles, metadata)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _fill_mbtiles(tmp, tiles, metadata: dict):
+    con = sqlite3.connect(tmp)     # arquivo vazio do mkstemp: o SQLite o inicializa como banco novo
+    try:
+        con.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        con.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+        con.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        con.executemany("INSERT INTO metadata VALUES (?, ?)", [(k, str(v)) for k, v in metadata.items()])
+        # MBTiles usa linhas TMS (y de baixo para cima)
+        con.executemany("INSERT INTO tiles VALUES (?, ?, ?, ?)",
+                        [(z, x, (2 ** z - 1) - y, data) for (z, x, y), data in sorted(tiles.items())])
+        con.commit()
+    finally:
+        con.close()
+
+def main():
+    z0, z1 = int(TILES.get("zoom_min", 8)), int(TILES.get("zoom_max", 14))
+    extent, buffer = int(TILES.get("extent", 4096)), int(TILES.get("buffer", 64))
+    layer = TILES.get("layer", "distritos")
+    fields = list(TILES.get("fields", ["tier", "llm_score", "rank_sp"]))
+    level = int(TILES.get("gzip_level", 9))
+    px = float(TILES.get("simplify_px", 0.5))
+
+    t0 = time.perf_counter()
+    g = load_distritos(IN_DIST)
+    props, fids = attributes(g, fields), feature_ids(g)
+    bounds = [float(v) for v in g.total_bounds]
+    lat = (bounds[1] + bounds[3]) / 2
+    base, crs = clean_coverage(g, GAP_M)
+
+    tiles, raw = {}, 0
+    for z in range(z0, z1 + 1):
+        tol = px * ground_resolution(lat, z)
+        geoms = gpd.GeoSeries(shapely.coverage_simplify(base, tol), crs=crs).to_crs(3857).values
+        tree = shapely.STRtree(geoms)
+        x0, y0, x1, y1 = tile_range(bounds, z)
+        n = 0
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                minx, miny, maxx, maxy = tile_bounds(z, x, y)
+                pad = (maxx - minx) * buffer / extent
+                idx = tree.query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad))
+                if not len(idx):
+                    continue
+                idx.sort()
+                local = tile_coords(geoms[idx], z, x, y, extent, buffer)
+                pbf = encode_tile(layer, ((fids[i], gm, props[i]) for i, gm in zip(idx, local) if not gm.is_empty), extent)
+                if pbf:
+                    raw += len(pbf)
+                    tiles[(z, x, y)] = gzip.compress(pbf, compresslevel=level, mtime=0)
+                    n += 1
+        print(f"[tiles] z{z}: {n} tile(s) | simplificação {tol:.1f} m")
+
+    meta = {
+        "name": layer, "format": "pbf", "type": "overlay", "version": "1",
+        "minzoom": z0, "maxzoom": z1,
+        "bounds": ",".join(f"{v:.6f}" for v in bounds),
+        "center": f"{(bounds[0] + bounds[2]) / 2:.6f},{lat:.6f},{z0}",
+        "json": json.dumps({"vector_layers": [{"id": layer, "minzoom": z0, "maxzoom": z1,
+                                               "fields": {f: ("String" if f == "tier" else "Number") for f in fields}}]}),
+    }
+    write_mbtiles(OUT_MBT, tiles, meta)
+    packed = sum(map(len, tiles.values()))
+    print(f"[ok] MBTiles → {OUT_MBT} | {len(tiles)} tiles z{z0}-{z1} | pbf {raw/1e6:.2f} MB, gzip {packed/1e6:.2f} MB"
+          f" | {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# contract.py
+"""
+Validação do contrato da resposta do LLM contra o schema do ranking.
+
+O schema é compilado uma vez (jsonschema, Draft 2020-12) e a resposta inteira é
+checada numa passada; os erros saem agrupados por item (índice, id, caminho,
+tipo = palavra-chave do schema que falhou). Além do schema, confere a lista de
+ids contra a entrada: ausentes, desconhecidos e repetidos.
+
+ContractStats acumula as checagens de uma execução (thread-safe) para medir com
+que frequência o modelo quebra o contrato; dump() grava o resumo em JSON.
+
+jsonschema é opcional: sem ele só as checagens de ids são feitas.
+"""
+import os, json, threading
+from collections import Counter
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+MAX_REPORTED = 50   # erros detalhados guardados por resposta (as contagens são completas)
+
+def _strip_length(schema: dict) -> dict:
+    """Cópia do schema sem min/maxItems do ranking (o nº esperado varia por requisição)."""
+    s = json.loads(json.dumps(schema))
+    arr = s.get("properties", {}).get("ranking", {})
+    arr.pop("minItems", None)
+    arr.pop("maxItems", None)
+    return s
+
+def _norm_id(v) -> str:
+    return str(v).replace(".0", "")
+
+class Checker:
+    """Schema compilado uma vez; check() valida uma resposta inteira contra os ids esperados."""
+
+    def __init__(self, schema: dict):
+        self.validator = None
+        if jsonschema is not None:
+            s = _strip_length(schema)
+            cls = jsonschema.validators.validator_for(s, default=jsonschema.Draft202012Validator)
+            cls.check_schema(s)
+            self.validator = cls(s)
+
+    def check(self, out, expected_ids) -> dict:
+        expected = [_norm_id(i) for i in expected_ids]
+        items = out.get("ranking") if isinstance(out, dict) else None
+        items = items if isinstance(items, list) else []
+        ids = [_norm_id(it.get("id")) if isinstance(it, dict) else None for it in items]
+
+        errors, kinds, bad_items = [], Counter(), set()
+
+        def add(kind, item=None, path="", message=""):
+            kinds[kind] += 1
+            if item is not None:
+                bad_items.add(item)
+            if len(errors) < MAX_REPORTED:
+                errors.append({"item": item, "id": ids[item] if item is not None else None,
+                               "path": path, "kind": kind, "message": message})
+
+        if self.validator is not None:
+            for e in self.validator.iter_errors(out if isinstance(out, dict) else {}):
+                p = list(e.absolute_path)
+                item = p[1] if len(p) > 1 and p[0] == "ranking" and isinstance(p[1], int) else None
+                add(e.validator, item, "/".join(map(str, p)), e.message[:200])
+
+        known, seen = set(expected), set()
+        for k, did in enumerate(ids):
+            if did is None:
+                continue
+            if did not in known:
+                add("unknown_id", k, f"ranking/{k}/id", f"id {did!r} não está na entrada")
+            elif did in seen:
+                add("duplicate_id", k, f"ranking/{k}/id", f"id {did!r} repetido")
+            seen.add(did)
+        missing = [i for i in expected if i not in seen]
+        for i in missing[:MAX_REPORTED]:
+            add("missing_id", None, "ranking", f"id {i!r} ausente")
+        if len(missing) > MAX_REPORTED:
+            kinds["missing_id"] += len(missing) - MAX_REPORTED
+
+        return {
+            "ok": not kinds,
+            "expected": len(expected),
+            "received": len(items),
+            "items_with_errors": len(bad_items),
+            "kinds": dict(kinds),
+            "missing": missing,
+            "errors": errors,
+        }
+
+class ContractStats:
+    """Contagens agregadas de uma execução (respostas fora do contrato, itens com erro, erros por tipo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = self.violations = self.items = self.bad_items = 0
+        self.kinds = Counter()
+        self.samples = []
+
+    def add(self, report: dict):
+        with self._lock:
+            self.responses += 1
+            self.violations += not report["ok"]
+            self.items += report["received"]
+            self.bad_items += report["items_with_errors"]
+            self.kinds.update(report["kinds"])
+            if not report["ok"] and len(self.samples) < 5:
+                self.samples.append({k: report[k] for k in ("expected", "received", "kinds", "errors")})
+
+    def summary(self) -> str:
+        kinds = ", ".join(f"{k}={v}" for k, v in self.kinds.most_common())
+        return (f"{self.violations}/{self.responses} resposta(s) fora do contrato; "
+                f"itens com erro: {self.bad_items}/{self.items}" + (f"; {kinds}" if kinds else ""))
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"responses": self.responses, "violations": self.violations, "items": self.items,
+                       "items_with_errors": self.bad_items, "kinds": dict(self.kinds.most_common()),
+                       "jsonschema": jsonschema is not None, "samples": self.samples},
+                      f, ensure_ascii=False, indent=2)
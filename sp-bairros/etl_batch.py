@@ -0,0 +1,126 @@
+# etl_batch.py
+"""
+Modo batch do ETL: vários (município, ano) em paralelo.
+
+Os jobs vêm de `batch.jobs` no config.yaml. Cada tabela INEP distinta (ex.: o
+arquivo nacional) é lida UMA vez no processo principal (com o cache de
+ingest.py) e particionada pela coluna de município; cada worker recebe só a
+sua partição. O store de geometrias (geostore.py) também é preparado uma vez antes do pool.
+Cada job grava agg.parquet / norm_for_llm.json no próprio prefixo:
+    {batch.out_root}/{municipio}/{ano}/
+
+Uso:
+    python etl_batch.py                  # todos os jobs
+    python etl_batch.py --workers 2      # limita o pool
+    python etl_batch.py --config x.yaml  # workers também usam x.yaml (via SP_CONFIG)
+"""
+import os, sys, time, argparse, importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import yaml
+
+from geostore import DEFAULT_CRS, load_districts
+from ingest import load_inep_table, slug
+
+CONFIG = os.environ.get("SP_CONFIG", "config.yaml")
+
+def job_prefix(job, out_root) -> str:
+    return os.path.join(out_root, slug(job["municipio"]), str(job.get("year", "na")))
+
+def _load_etl(config):
+    """
+    etl_sp_capital lê o config no import (SP_CONFIG). O worker aponta SP_CONFIG para o
+    config do batch e recarrega o módulo se ele já tiver sido importado com outro arquivo.
+    """
+    os.environ["SP_CONFIG"] = config
+    import etl_sp_capital as etl
+    if os.path.abspath(etl.CONFIG) != os.path.abspath(config):
+        etl = importlib.reload(etl)
+    return etl
+
+def _run_job(job, inep_part, prefix, config=CONFIG):
+    """Executado no worker: carrega o ETL com o config do batch e roda um município/ano."""
+    etl = _load_etl(config)
+    t0 = time.perf_counter()
+    agg = etl.run_etl(
+        dist_path=job["distritos_geojson"],
+        inep=inep_part,
+        ideb_path=job.get("ideb_csv"),
+        mapa_path=job.get("mapa_ods"),
+        mapa_sheet=job.get("mapa_sheet"),
+        out_agg=os.path.join(prefix, "agg.parquet"),
+        out_norm=os.path.join(prefix, "norm_for_llm.json"),
+    )
+    return len(agg), time.perf_counter() - t0
+
+def partition_inep(jobs, cfg, cache_dir) -> dict:
+    """
+    {(inep_csv, municipio): tabela} — cada CSV é lido uma vez e particionado por município.
+    O valor de `municipio` do job é comparado como texto (código IBGE ou nome).
+    """
+    parts = {}
+    for path in dict.fromkeys(j["inep_csv"] for j in jobs):
+        table = load_inep_table(path, cfg["schema"]["inep"], cache_dir=cache_dir)
+        wanted = {str(j["municipio"]) for j in jobs if j["inep_csv"] == path}
+        if "municipio" not in table.columns:
+            if len(wanted) > 1:
+                raise ValueError(f"{path}: sem coluna de município (schema.inep.municipio) para particionar {sorted(wanted)}.")
+            parts[(path, next(iter(wanted)))] = table
+            continue
+        key = table["municipio"].astype(str)
+        sel = key.isin(wanted).to_numpy()
+        for m, g in table[sel].groupby(key[sel].to_numpy()):
+            parts[(path, m)] = g.reset_index(drop=True)
+        print(f"[batch] {path}: {len(table)} escolas lidas 1x, {len(wanted)} município(s) particionado(s)")
+    return parts
+
+def prepare_geo(jobs, cfg):
+    """
+    Store de geometrias de cada GeoJSON distinto pronto ANTES dos workers: com o
+    store frio, jobs que compartilham o arquivo não o regeram todos ao mesmo tempo.
+    Mesmo store/CRS que etl_sp_capital.load_distritos usa para o caminho.
+    """
+    inp = cfg["inputs"]
+    for src in dict.fromkeys(j["distritos_geojson"] for j in jobs):
+        store = cfg["outputs"].get("geo_store") if src == inp["distritos_geojson"] else None
+        load_districts(src, store=store, assume_crs=inp.get("distritos_crs", DEFAULT_CRS))
+
+def run_batch(cfg, workers=None, config=CONFIG) -> list:
+    b = cfg.get("batch", {})
+    jobs = b.get("jobs", [])
+    if not jobs:
+        raise SystemExit("[erro] config.yaml não tem batch.jobs.")
+    out_root = b.get("out_root", "out/batch")
+    workers = workers or b.get("workers") or os.cpu_count()
+    cache_dir = cfg["outputs"].get("cache_dir", "out/cache")
+
+    prepare_geo(jobs, cfg)
+    parts = partition_inep(jobs, cfg, cache_dir)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futs = {}
+        for job in jobs:
+            part = parts.get((job["inep_csv"], str(job["municipio"])))
+            if part is None or part.empty:
+                print(f"[batch] AVISO: nenhuma escola para municipio={job['municipio']!r} em {job['inep_csv']}; pulando.")
+                continue
+            prefix = job_prefix(job, out_root)
+            futs[ex.submit(_run_job, job, part, prefix, config)] = (job, prefix)
+        for f in as_completed(futs):
+            job, prefix = futs[f]
+            try:
+                n, dt = f.result()
+                print(f"[ok] batch {job['municipio']}/{job.get('year','na')}: {n} distritos em {dt:.1f}s → {prefix}")
+                results.append((job, prefix, "ok"))
+            except Exception as e:
+                print(f"[batch] FALHOU {job['municipio']}/{job.get('year','na')}: {e}")
+                results.append((job, prefix, f"erro: {e}"))
+    return results
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="ETL em lote (vários municípios/anos) com pool de processos.")
+    ap.add_argument("--config", default=CONFIG)
+    ap.add_argument("--workers", type=int, default=None)
+    a = ap.parse_args()
+    cfg = yaml.safe_load(open(a.config, "r", encoding="utf-8"))
+    res = run_batch(cfg, workers=a.workers, config=a.config)
+    sys.exit(1 if any(st != "ok" for _, _, st in res) else 0)
@@ -0,0 +1,138 @@
+# fc_writer.py
+"""
+Escrita em streaming de FeatureCollection GeoJSON minificada.
+
+As geometrias são codificadas em lote (shapely.to_geojson) e as properties
+chegam já serializadas; cada Feature é escrita direto no arquivo e, na mesma
+passada, alimenta os compressores pedidos (Brotli -> <saída>.br, gzip ->
+<saída>.gz, zstd -> <saída>.zst). Tudo é gravado num .tmp único (mkstemp, como
+ingest.atomic_write) e trocado atomicamente no final: builds concorrentes não
+pisam no .tmp um do outro.
+"""
+import os, json, zlib, itertools, tempfile
+import numpy as np
+import shapely
+
+try:
+    import brotli
+except ImportError:          # sem brotli: só gzip/identity
+    brotli = None
+try:
+    import zstandard
+except ImportError:          # sem zstandard: sem .zst
+    zstandard = None
+
+SUFFIX = {"br": ".br", "gzip": ".gz", "zstd": ".zst"}
+
+def dumps(obj) -> str:
+    """JSON minificado no mesmo formato do minify do server.py."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def geometry_json(geoms) -> list:
+    """GeoJSON de cada geometria (minificado), codificado em lote; None -> 'null'."""
+    arr = np.asarray(geoms, dtype=object)
+    out = shapely.to_geojson(arr)
+    return ["null" if s is None else s for s in out.tolist()]
+
+class _Sink:
+    """Arquivo .tmp único (mkstemp no diretório de destino) + compressor incremental opcional."""
+
+    def __init__(self, path, encoding=None, brotli_quality=11, gzip_level=9, zstd_level=19):
+        fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        os.fchmod(fd, 0o644)      # artefato servido (CDN/estático), não só cache local: mkstemp cria 0600
+        self.path = path
+        self.f = os.fdopen(fd, "wb")
+        if encoding == "br":
+            self.comp = brotli.Compressor(quality=brotli_quality, mode=brotli.MODE_TEXT)
+            self.finish = self.comp.finish
+            self.feed = self.comp.process
+        elif encoding == "gzip":
+            # wbits 31 = container gzip (cabeçalho + crc), mesmo formato do gzip.compress
+            self.comp = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self.finish = self.comp.flush
+            self.feed = self.comp.compress
+        elif encoding == "zstd":
+            self.comp = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+            self.finish = self.comp.flush
+            self.feed = self.comp.compress
+        else:
+            self.comp = None
+
+    def write(self, b: bytes):
+        self.f.write(self.feed(b) if self.comp else b)
+
+    def close(self):
+        if self.comp:
+            self.f.write(self.finish())
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+def write_stream(path, chunks, precompress=(), brotli_quality=11, gzip_level=9, zstd_level=19) -> dict:
+    """
+    Grava os pedaços (str) em `path` e, na mesma passada, nos .br/.gz/.zst pedidos em
+    `precompress`. Devolve {caminho: bytes gravados}.
+    """
+    encs = [e for e in precompress if e in SUFFIX]
+    if "br" in encs and brotli is None:
+        print("[build] brotli não instalado; pulando .br")
+        encs.remove("br")
+    if "zstd" in encs and zstandard is None:
+        print("[build] zstandard não instalado; pulando .zst")
+        encs.remove("zstd")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sinks = [_Sink(path)] + [_Sink(path + SUFFIX[e], e, brotli_quality, gzip_level, zstd_level) for e in encs]
+    try:
+        for chunk in chunks:
+            b = chunk.encode("utf-8")
+            for s in sinks:
+                s.write(b)
+    except BaseException:
+        for s in sinks:
+            s.f.close()
+            os.remove(s.tmp)
+        raise
+    for s in sinks:
+        s.close()
+    return {s.path: os.path.getsize(s.path) for s in sinks}
+
+def _batched(items, chunk):
+    buf = []
+    for it in items:
+        buf.append(it)
+        if len(buf) >= chunk:
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+
+def write_feature_collection(path, props_json, geoms_json, precompress=(), brotli_quality=11, gzip_level=9,
+                             zstd_level=19, chunk_features=256, ids=None) -> dict:
+    """
+    Grava {"type":"FeatureCollection","features":[...]} minificado em `path` (e nos
+    .br/.gz/.zst pedidos em `precompress`). Com `ids`, cada Feature leva "id" (membro
+    do GeoJSON, fora das properties). Devolve {caminho: bytes gravados}.
+    """
+    heads = (('{"type":"Feature","id":' + dumps(i) + ',"geometry":' for i in ids) if ids is not None
+             else itertools.repeat('{"type":"Feature","geometry":'))
+    feats = ((',' if k else '') + h + g + ',"properties":' + p + "}"
+             for k, (h, p, g) in enumerate(zip(heads, props_json, geoms_json)))
+
+    def chunks():
+        yield '{"type":"FeatureCollection","features":['
+        yield from _batched(feats, chunk_features)
+        yield "]}"
+    return write_stream(path, chunks(), precompress, brotli_quality, gzip_level, zstd_level)
+
+def write_attribute_table(path, ids, props_json, precompress=(), brotli_quality=11, gzip_level=9, zstd_level=19,
+                          chunk_rows=256) -> dict:
+    """
+    Tabela de atributos por id: {"<id>": {properties}, ...} minificada (mesmas properties
+    das Features), com as mesmas variantes comprimidas. Devolve {caminho: bytes gravados}.
+    """
+    rows = ((',' if k else '') + dumps(str(i)) + ":" + p for k, (i, p) in enumerate(zip(ids, props_json)))
+
+    def chunks():
+        yield "{"
+        yield from _batched(rows, chunk_rows)
+        yield "}"
+    return write_stream(path, chunks(), precompress, brotli_quality, gzip_level, zstd_level)
@@ -0,0 +1,129 @@
+# geo_assign.py
+"""
+Atribuição ponto -> distrito com STRtree preparado (shapely 2).
+
+Substitui o `gpd.sjoin(predicate="intersects", how="left")` do ETL e o reparo
+de colunas duplicadas que vinha depois. Cada ponto recebe no máximo UM distrito.
+
+Regra de desempate (pontos que tocam mais de um polígono, ex.: divisa entre distritos):
+  1. vence o distrito que contém o ponto no interior (contains_properly);
+  2. se o ponto está só em bordas, vence o distrito de menor posição no índice,
+     que é ordenado pelo valor numérico do `id` (ou seja: menor id; ids não
+     numéricos vão depois, em ordem de texto).
+Pontos fora de todos os polígonos ficam sem distrito (posição -1 / id NaN).
+
+Modo incremental: as atribuições ficam gravadas por `id_escola` (com lon/lat);
+na próxima execução só escolas novas ou que mudaram de coordenada são consultadas.
+O arquivo é compartilhado por todas as chamadas com o mesmo índice (ex.: jobs do
+etl_batch): cada uma acrescenta/atualiza as suas escolas, sem apagar as das outras.
+"""
+import os, hashlib
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from ingest import CACHE_DIR, read_cache, write_cache
+
+class DistrictIndex:
+    """Polígonos de distrito ordenados por id (numérico) + STRtree sobre eles."""
+
+    def __init__(self, ids, names, norms, geoms):
+        ids = np.asarray(ids)
+        if ids.dtype.kind in "US":
+            ids = ids.astype(object)
+        text = ids.astype(str)
+        num = pd.to_numeric(pd.Series(text), errors="coerce").to_numpy(dtype="float64")
+        order = np.lexsort((text, np.isnan(num), num))   # numérico; não numéricos (NaN) por último, por texto
+        self.ids   = ids[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.norms = np.asarray(norms, dtype=object)[order]
+        self.geoms = np.asarray(geoms, dtype=object)[order]
+        shapely.prepare(self.geoms)
+        self.tree = STRtree(self.geoms)
+        self.fingerprint = self._fingerprint()
+
+    @classmethod
+    def from_gdf(cls, g):
+        """A partir do GeoDataFrame de distritos do ETL (colunas id, name, _norm, geometry; EPSG:4326)."""
+        norms = g["_norm"] if "_norm" in g.columns else g["name"]
+        return cls(g["id"].to_numpy(), g["name"].to_numpy(), norms.to_numpy(), g.geometry.to_numpy())
+
+    def _fingerprint(self) -> str:
+        h = hashlib.sha256()
+        for i, w in zip(self.ids, shapely.to_wkb(self.geoms)):
+            h.update(str(i).encode()); h.update(w)
+        return h.hexdigest()[:20]
+
+    # ---------- consulta ----------
+    def assign(self, lon, lat) -> np.ndarray:
+        """Posição (int64) do distrito de cada ponto; -1 quando fora de todos."""
+        lon = np.asarray(lon, dtype="float64")
+        lat = np.asarray(lat, dtype="float64")
+        out = np.full(len(lon), -1, dtype="int64")
+        if len(lon) == 0:
+            return out
+        pts = shapely.points(lon, lat)
+        pi, ti = self.tree.query(pts, predicate="intersects")
+        if len(pi) == 0:
+            return out
+        # desempate: interior primeiro, depois menor posição (= menor id numérico)
+        interior = shapely.contains_properly(self.geoms[ti], pts[pi])
+        order = np.lexsort((ti, ~interior, pi))
+        pi, ti = pi[order], ti[order]
+        first = np.unique(pi, return_index=True)[1]
+        out[pi[first]] = ti[first]
+        return out
+
+    def take(self, pos):
+        """(bairro_id, bairro_name, _norm_name) para as posições; -1 vira NaN."""
+        pos = np.asarray(pos)
+        ids   = np.append(self.ids, np.nan)[pos]
+        names = np.append(self.names, np.nan)[pos]
+        norms = np.append(self.norms, np.nan)[pos]
+        return ids, names, norms
+
+def assignments_path(fingerprint, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"district_assign_{fingerprint}.parquet")
+
+def _incremental_positions(idx, schools, cache_dir):
+    """Reaproveita atribuições gravadas para escolas com mesmo id_escola e mesmas coordenadas."""
+    ap = assignments_path(idx.fingerprint, cache_dir)
+    prev = read_cache(ap)
+    cur = pd.DataFrame({"id_escola": schools["id_escola"].to_numpy(),
+                        "lon": schools["lon"].to_numpy(dtype="float64"),
+                        "lat": schools["lat"].to_numpy(dtype="float64")})
+    pos = np.full(len(cur), -2, dtype="int64")   # -2 = ainda não atribuído
+    if prev is not None:
+        prev = prev.drop_duplicates("id_escola", keep="last")
+        m = cur.merge(prev, on="id_escola", how="left", suffixes=("", "_prev"))
+        same = (m["lon"].to_numpy() == m["lon_prev"].to_numpy()) & (m["lat"].to_numpy() == m["lat_prev"].to_numpy())
+        pos[same] = m.loc[same, "pos"].to_numpy(dtype="int64")
+    todo = pos == -2
+    if todo.any():
+        pos[todo] = idx.assign(cur.loc[todo, "lon"], cur.loc[todo, "lat"])
+    print(f"[join] atribuições reaproveitadas: {int((~todo).sum())} | novas consultas: {int(todo.sum())}")
+    new = cur.assign(pos=pos).dropna(subset=["id_escola"])
+    # relê na hora de gravar: mantém as escolas que outras chamadas (outros municípios/anos) gravaram
+    prev = read_cache(ap)
+    if prev is not None:
+        new = pd.concat([prev[~prev["id_escola"].isin(new["id_escola"])], new], ignore_index=True)
+    write_cache(new, ap)
+    return pos
+
+def assign_districts(schools, idx: DistrictIndex, cache_dir=CACHE_DIR, incremental=False):
+    """
+    Devolve `schools` com bairro_id / bairro_name / _norm_name (uma linha por escola,
+    mesma ordem da entrada). Com incremental=True reaproveita atribuições persistidas.
+    """
+    if incremental and "id_escola" in schools.columns:
+        pos = _incremental_positions(idx, schools, cache_dir)
+    else:
+        pos = idx.assign(schools["lon"], schools["lat"])
+    out = schools.copy()
+    out["bairro_id"], out["bairro_name"], out["_norm_name"] = idx.take(pos)
+    return out
+
+def build_index(gdist) -> DistrictIndex:
+    """Índice dos distritos (STRtree refeito a cada execução; só as atribuições são persistidas)."""
+    return DistrictIndex.from_gdf(gdist)
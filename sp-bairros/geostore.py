@@ -0,0 +1,115 @@
+# geostore.py
+"""
+Store único de geometrias de distrito (reprojeta uma vez, reusa em todos os estágios).
+
+A partir do GeoJSON bruto grava um GeoParquet canônico em EPSG:4326 com:
+  id       — código oficial só com dígitos, em texto (ex.: '8583465')
+  name     — nome oficial (strip)
+  _norm    — nome normalizado p/ joins (names.norm_series)
+  minx/miny/maxx/maxy — bounds
+  cx/cy    — centróide (calculado no CRS projetado de origem e reprojetado)
+  geometry
+
+ETL, build e fix_geojson_names leem daqui; o GeoJSON só é reprocessado quando
+o hash do arquivo (ou a versão do store) muda. Metadados em <store>.meta.json.
+
+Uso avulso:
+    python geostore.py [geojson] [store]
+"""
+import os, sys, json
+import pandas as pd
+import geopandas as gpd
+
+from ingest import atomic_write, file_sha256
+from names import norm_series
+
+GEO_DIR = "out/geo"
+STORE_VERSION = 1
+DEFAULT_CRS = 31983   # SIRGAS 2000 / UTM 23S quando o GeoJSON vem sem CRS (troque p/ 31984 se necessário)
+
+# candidatos (case-insensitive), em ordem de preferência
+NAME_CANDIDATES = ["nm_distrito_municipal", "nome_dist", "distritos", "distrito", "nome_distrito", "nome", "name"]
+ID_CANDIDATES   = ["cd_identificador_distrito", "cd_distrito_municipal", "cd_dist", "codigo", "id_distrito", "id"]
+
+def canonical_ids(s: pd.Series) -> pd.Series:
+    """Texto só com o último bloco de dígitos ('distrito_municipal_v2.8583462' / 8583462.0 -> '8583462')."""
+    c = s.astype(str).str.replace(r"\.0+$", "", regex=True).str.replace(r"\s+", "", regex=True)
+    return c.str.extract(r"(\d+)$")[0].fillna(c).astype(object)
+
+def store_path(src, geo_dir=GEO_DIR) -> str:
+    stem = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(geo_dir, f"{stem}.geoparquet")
+
+def _pick(cols_low: dict, candidates):
+    for c in candidates:
+        if c in cols_low:
+            return cols_low[c]
+    return None
+
+def _write_meta(tmp, meta: dict):
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+def prepare(src, dst, assume_crs=DEFAULT_CRS) -> gpd.GeoDataFrame:
+    """Lê o GeoJSON bruto, canoniza id/name, reprojeta e grava o GeoParquet + meta."""
+    g = gpd.read_file(src)
+    if g.crs is None:
+        g = g.set_crs(assume_crs)
+        print(f"[geo] {src} sem CRS; assumindo EPSG:{assume_crs}")
+
+    cols_low = {c.lower(): c for c in g.columns if c != "geometry"}
+    name_col = _pick(cols_low, NAME_CANDIDATES)
+    id_col   = _pick(cols_low, ID_CANDIDATES)
+
+    out = gpd.GeoDataFrame(index=range(len(g)))
+    if name_col:
+        out["name"] = g[name_col].astype(str).str.strip().to_numpy()
+    else:
+        out["name"] = [f"distrito_{i}" for i in range(len(g))]
+        print("[geo] AVISO: não encontrei 'nm_distrito_municipal' (ou equivalente). Usando nome sintético.")
+    if id_col:
+        out["id"] = canonical_ids(g[id_col]).to_numpy()
+    else:
+        out["id"] = [str(i) for i in range(len(g))]
+        print("[geo] AVISO: não encontrei 'cd_identificador_distrito' (ou eq.). Usando id sintético.")
+    out["_norm"] = norm_series(out["name"]).to_numpy()
+
+    # centróide no CRS projetado (métrico) quando houver; depois tudo em 4326
+    proj = g.geometry if g.crs.is_projected else g.geometry.to_crs(g.geometry.estimate_utm_crs())
+    cent = gpd.GeoSeries(proj.centroid, crs=proj.crs).to_crs(4326)
+    geom = g.geometry.to_crs(4326)
+    b = geom.bounds
+    out["minx"], out["miny"], out["maxx"], out["maxy"] = (b[k].to_numpy() for k in ("minx", "miny", "maxx", "maxy"))
+    out["cx"], out["cy"] = cent.x.to_numpy(), cent.y.to_numpy()
+    out = out.set_geometry(geom.to_numpy(), crs=4326)
+    out = out[["id", "name", "_norm", "minx", "miny", "maxx", "maxy", "cx", "cy", "geometry"]]
+
+    # parquet antes do meta: meta novo só aparece quando o store correspondente já está no lugar
+    meta = {"source": src, "source_sha256": file_sha256(src), "version": STORE_VERSION,
+            "assume_crs": assume_crs, "n": len(out)}
+    atomic_write(dst, lambda tmp: out.to_parquet(tmp, index=False))
+    atomic_write(dst + ".meta.json", lambda tmp: _write_meta(tmp, meta))
+    print(f"[geo] store de geometrias: {dst} ({len(out)} distritos)")
+    return out
+
+def is_fresh(src, dst, assume_crs=DEFAULT_CRS) -> bool:
+    try:
+        meta = json.load(open(dst + ".meta.json", "r", encoding="utf-8"))
+    except Exception:
+        return False
+    return (os.path.exists(dst) and meta.get("version") == STORE_VERSION
+            and meta.get("assume_crs") == assume_crs and meta.get("source_sha256") == file_sha256(src))
+
+def load_districts(src, store=None, assume_crs=DEFAULT_CRS) -> gpd.GeoDataFrame:
+    """Distritos canônicos (EPSG:4326) do store; (re)gera a partir de `src` se faltar ou estiver velho."""
+    store = store or store_path(src)
+    if is_fresh(src, store, assume_crs):
+        return gpd.read_parquet(store)
+    return prepare(src, store, assume_crs=assume_crs)
+
+if __name__ == "__main__":
+    import yaml
+    cfg = yaml.safe_load(open(os.environ.get("SP_CONFIG", "config.yaml"), "r", encoding="utf-8"))
+    src = sys.argv[1] if len(sys.argv) > 1 else cfg["inputs"]["distritos_geojson"]
+    dst = sys.argv[2] if len(sys.argv) > 2 else cfg["outputs"].get("geo_store") or store_path(src)
+    prepare(src, dst, assume_crs=cfg["inputs"].get("distritos_crs", DEFAULT_CRS))
@@ -0,0 +1,216 @@
+# ingest.py
+"""
+Ingestão colunar com cache em Parquet.
+
+Lê só as colunas resolvidas pelo schema do config.yaml, com dtypes explícitos,
+e guarda um sidecar Parquet em `out/cache/` chaveado por hash do arquivo
+fonte + fatia do schema (ou aba, no caso das planilhas). Execuções seguintes
+com as mesmas entradas pulam o parse do CSV e o odfpy.
+
+Uso avulso (pré-aquece o cache de todas as edições do Mapa no config):
+    python ingest.py
+"""
+import os, re, sys, json, hashlib, tempfile, unicodedata
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = "out/cache"
+CACHE_VERSION = 1   # incremente ao mudar o formato/normalização gravados no cache
+
+# colunas categóricas (poucos valores distintos, muitas linhas)
+INEP_CATEGORICAL = ["rede", "localizacao", "etapa", "municipio"]
+INEP_OPTIONAL    = ["rede", "localizacao", "etapa", "endereco", "municipio"]
+
+REDE_MAP = {
+    "municipal":"municipal", "pública municipal":"municipal", "pública/municipal":"municipal",
+    "estadual":"estadual", "pública estadual":"estadual", "pública/estadual":"estadual",
+    "privada":"privada", "particular":"privada"
+}
+
+# =================== helpers ===================
+
+def first_col(df, candidates):
+    """Encontra a primeira coluna do DF que casa com a lista de candidatos (case-insensitive)."""
+    if not candidates:
+        return None
+    m = {c.lower(): c for c in df.columns}
+    for cand in candidates:
+        if cand.lower() in m:
+            return m[cand.lower()]
+    # regex leve (quando candidatos contiverem padrões)
+    for c in df.columns:
+        lc = c.lower()
+        for cand in candidates:
+            if cand.startswith("^") and re.fullmatch(cand, lc):
+                return c
+    return None
+
+def file_sha256(path, chunk=1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for b in iter(lambda: f.read(chunk), b""):
+            h.update(b)
+    return h.hexdigest()
+
+def cache_key(path, *parts) -> str:
+    """Hash do conteúdo do arquivo + partes extras (schema, aba, ...) serializadas em JSON."""
+    h = hashlib.sha256()
+    h.update(file_sha256(path).encode())
+    h.update(json.dumps([CACHE_VERSION, *parts], sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()[:20]
+
+def cache_path(kind: str, key: str, cache_dir=CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{kind}_{key}.parquet")
+
+def slug(s) -> str:
+    """Nome seguro p/ arquivo/pasta: minúsculas, sem acento, separadores como '-'."""
+    s = unicodedata.normalize("NFKD", str(s).lower())
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return re.sub(r"[^a-z0-9]+", "-", s).strip("-") or "x"
+
+def read_cache(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path, engine="pyarrow")
+    except Exception as e:
+        print(f"[cache] ignorando cache corrompido {path}: {e}")
+        return None
+
+def atomic_write(path, write):
+    """
+    write(tmp) num tmp único (mkstemp) no mesmo diretório + os.replace: nunca deixa o
+    arquivo pela metade, e escritores concorrentes não disputam o mesmo .tmp.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def write_cache(df: pd.DataFrame, path):
+    """Grava o Parquet de forma atômica (atomic_write) para não deixar cache pela metade."""
+    atomic_write(path, lambda tmp: df.to_parquet(tmp, engine="pyarrow", index=False))
+
+# =================== INEP ===================
+
+def resolve_inep_columns(path, schema) -> dict:
+    """Lê só o cabeçalho do CSV e devolve {coluna_fonte: nome_canônico}."""
+    header = pd.read_csv(path, nrows=0)
+    col_id  = first_col(header, schema["id_escola"])
+    col_lon = first_col(header, schema["lon"])
+    col_lat = first_col(header, schema["lat"])
+    if not all([col_id, col_lon, col_lat]):
+        raise ValueError("INEP cadastral: preciso de Código INEP (id_escola) + Latitude + Longitude.")
+    cols = {col_id: "id_escola", col_lon: "lon", col_lat: "lat"}
+    for canon in INEP_OPTIONAL:
+        c = first_col(header, schema.get(canon, []))
+        if c and c not in cols:
+            cols[c] = canon
+    return cols
+
+def _parse_inep(path, cols: dict) -> pd.DataFrame:
+    dtype = {src: ("category" if canon in INEP_CATEGORICAL else "string")
+             for src, canon in cols.items() if canon in INEP_OPTIONAL}
+    df = pd.read_csv(path, usecols=list(cols), dtype=dtype).rename(columns=cols)
+
+    df["id_escola"] = pd.to_numeric(df["id_escola"], errors="coerce").astype("Int64")
+    df["lon"] = pd.to_numeric(df["lon"], errors="coerce").astype("float64")
+    df["lat"] = pd.to_numeric(df["lat"], errors="coerce").astype("float64")
+
+    if "rede" in df.columns:
+        # normaliza só as categorias (poucas), não as linhas
+        m = {c: REDE_MAP.get(str(c).strip().lower(), str(c).strip().lower()) for c in df["rede"].cat.categories}
+        df["rede"] = df["rede"].map(m).astype("category")
+    return df
+
+def load_inep_table(path, schema, cache_dir=CACHE_DIR, use_cache=True) -> pd.DataFrame:
+    """
+    Tabela INEP cadastral com colunas canônicas (id_escola, lon, lat e extras do schema).
+    Usa o sidecar Parquet se o arquivo e o schema não mudaram.
+    """
+    cols = resolve_inep_columns(path, schema)
+    key = cache_key(path, "inep", cols)
+    cp = cache_path("inep", key, cache_dir)
+    if use_cache:
+        df = read_cache(cp)
+        if df is not None:
+            print(f"[cache] INEP: {cp}")
+            return df
+    df = _parse_inep(path, cols)
+    if use_cache:
+        write_cache(df, cp)
+    return df
+
+# =================== planilhas (Mapa da Desigualdade) ===================
+
+def _typed_sheet(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Deixa a aba gravável em Parquet: nomes de coluna em str, colunas object
+    só com números viram float64 e o resto vira string (valores nulos preservados).
+    """
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for c in df.columns:
+        if df[c].dtype != object:
+            continue
+        vals = df[c].dropna()
+        if vals.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)).all():
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        else:
+            df[c] = df[c].map(lambda v: v if pd.isna(v) else str(v)).astype("string")
+    return df
+
+def _parse_sheet(path, sheet) -> pd.DataFrame:
+    engine = "odf" if path.endswith(".ods") else None
+    xls = pd.ExcelFile(path, engine=engine)
+    if sheet not in xls.sheet_names:
+        raise ValueError(f"Aba '{sheet}' não encontrada. Abas disponíveis: {xls.sheet_names}")
+    return pd.read_excel(xls, sheet_name=sheet)
+
+def load_sheet(path, sheet, cache_dir=CACHE_DIR, use_cache=True) -> pd.DataFrame:
+    """
+    Uma aba de planilha (.ods/.xlsx) como DataFrame tipado.
+    Com cache válido (hash do arquivo + nome da aba) não abre a planilha.
+    Cada edição/aba tem seu próprio arquivo, então várias coexistem em cache_dir.
+    """
+    if not use_cache:
+        return _typed_sheet(_parse_sheet(path, sheet))
+    key = cache_key(path, "sheet", sheet)
+    cp = cache_path(f"mapa_{slug(sheet)}", key, cache_dir)
+    df = read_cache(cp)
+    if df is not None:
+        print(f"[cache] planilha '{sheet}': {cp}")
+        return df
+    df = _typed_sheet(_parse_sheet(path, sheet))
+    write_cache(df, cp)
+    return df
+
+def mapa_editions(cfg) -> list:
+    """
+    Edições do Mapa configuradas: a atual (inputs.mapa_ods/mapa_sheet) +
+    inputs.mapa_editions ([{ods, sheet}, ...]) para backfills históricos.
+    """
+    inp = cfg["inputs"]
+    eds = [{"ods": inp["mapa_ods"], "sheet": inp["mapa_sheet"]}]
+    for e in inp.get("mapa_editions", []) or []:
+        if e not in eds:
+            eds.append(e)
+    return eds
+
+if __name__ == "__main__":
+    import yaml
+    cfg = yaml.safe_load(open(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("SP_CONFIG", "config.yaml"), "r", encoding="utf-8"))
+    cdir = cfg["outputs"].get("cache_dir", CACHE_DIR)
+    for ed in mapa_editions(cfg):
+        if not os.path.exists(ed["ods"]):
+            print(f"[cache] AVISO: {ed['ods']} não encontrado; pulando.")
+            continue
+        df = load_sheet(ed["ods"], ed["sheet"], cache_dir=cdir)
+        print(f"[ok] {ed['ods']} / {ed['sheet']}: {len(df)} linhas")
+    load_inep_table(cfg["inputs"]["inep_csv"], cfg["schema"]["inep"], cache_dir=cdir)
+    print(f"[ok] INEP: {cfg['inputs']['inep_csv']}")
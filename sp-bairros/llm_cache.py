@@ -0,0 +1,103 @@
+# llm_cache.py
+"""
+Cache em disco das respostas do LLM.
+
+Chave = sha256 de (url, model, messages, format, options) em JSON canônico;
+com temperature 0 a mesma requisição devolve a mesma resposta, então uma
+reexecução do ranking com norm/prompt/schema/modelo idênticos não chama o modelo.
+Cada resposta fica em `<dir>/<chave>.json` (gravação atômica), junto com o
+instante em que foi gravada: {"created": epoch, "value": resposta}.
+
+Despejo:
+  - max_age_days: entradas criadas há mais que isso contam como miss e são apagadas
+                  (idade pela criação: hits não estendem a validade)
+  - max_mb:       acima do limite, apaga as menos usadas (atime; hit renova só o atime)
+O mtime do arquivo fica no instante da gravação, então prune() vence entradas sem
+abrir cada arquivo; get() confere o "created" do próprio payload.
+"""
+import os, json, time, hashlib, tempfile, threading
+
+CACHE_VERSION = 2   # incremente ao mudar o que é gravado
+
+def request_key(req: dict) -> str:
+    """Hash da parte da requisição que determina a resposta (ignora 'stream')."""
+    payload = {k: req.get(k) for k in ("model", "messages", "format", "options")}
+    payload["url"] = req.get("url")
+    payload["v"] = CACHE_VERSION
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _rm(path) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:   # outra thread já apagou
+        return False
+
+class ResponseCache:
+    def __init__(self, cache_dir="out/cache/llm", max_mb=200, max_age_days=30):
+        self.dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.max_age_s = max_age_days * 86400 if max_age_days else None
+        self.hits = self.misses = self.evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.dir, f"{key}.json")
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key):
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if self.max_age_s and time.time() - float(entry["created"]) > self.max_age_s:
+                if _rm(p):
+                    self._count("evicted")
+                raise FileNotFoundError(p)
+            out = entry["value"]
+            os.utime(p, (time.time(), os.stat(p).st_mtime))   # LRU: hit renova o atime; mtime = criação
+        except (OSError, ValueError, KeyError, TypeError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return out
+
+    def put(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "value": value}, f, ensure_ascii=False)
+        os.replace(tmp, self._path(key))
+        self.prune()
+
+    def prune(self):
+        """Apaga entradas vencidas (mtime = criação) e, se passar de max_mb, as menos usadas (atime) primeiro."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for e in os.scandir(self.dir):
+                if not e.name.endswith(".json"):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:   # get() concorrente já apagou
+                    continue
+                if self.max_age_s and now - st.st_mtime > self.max_age_s:
+                    self.evicted += _rm(e.path)
+                else:
+                    entries.append((st.st_atime, st.st_size, e.path))
+            if not self.max_bytes:
+                return
+            total = sum(s for _, s, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self.evicted += _rm(path)
+                total -= size
+
+    def summary(self) -> str:
+        return f"{self.hits} hit(s), {self.misses} miss(es), {self.evicted} despejada(s)"
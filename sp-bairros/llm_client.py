@@ -0,0 +1,144 @@
+# llm_client.py
+"""
+Cliente HTTP do /api/chat (Ollama) com sessão reaproveitada e streaming.
+
+- Uma requests.Session por processo (pool de conexões keep-alive do tamanho
+  do nº de workers), em vez de uma conexão nova por requisição. O pool cresce
+  quando alguém pede mais workers do que o tamanho atual (nunca encolhe).
+- Com "stream": true o Ollama manda NDJSON: uma linha por pedaço, com o texto
+  em message.content e "done": true no fim. O texto acumulado é varrido à medida
+  que chega; cada item completo do array "ranking" é validado na hora
+  (RankingValidator) e, se o contrato já foi quebrado, a conexão é fechada e
+  ContractViolation sobe — o retry/fallback começa em segundos, não minutos.
+"""
+import json, threading
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_pool = 0
+_session_lock = threading.Lock()
+
+class ContractViolation(ValueError):
+    """A resposta (parcial) já viola o contrato do ranking. `partial` = {'ranking': itens válidos até ali}."""
+    partial = {"ranking": []}
+
+def session(pool_size=4) -> requests.Session:
+    global _session, _session_pool
+    pool_size = max(1, int(pool_size))
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool:
+            # adapter novo com pool maior; o antigo não é fechado (requisições em curso terminam nele)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session_pool = pool_size
+        return _session
+
+class RankingValidator:
+    """Valida itens do 'ranking' conforme chegam: ids conhecidos, na ordem de entrada, drivers permitidos."""
+
+    def __init__(self, ids, allowed_features, check_order=True):
+        self.ids = [str(i).replace(".0", "") for i in ids]
+        self.known = set(self.ids)
+        self.allowed = set(allowed_features)
+        self.check_order = check_order
+        self.seen = 0
+
+    def __call__(self, item):
+        i = self.seen
+        if not isinstance(item, dict):
+            raise ContractViolation(f"item {i} não é objeto")
+        did = str(item.get("id")).replace(".0", "")
+        if did not in self.known:
+            raise ContractViolation(f"item {i}: id desconhecido {did!r}")
+        if i >= len(self.ids):
+            raise ContractViolation(f"mais de {len(self.ids)} itens")
+        if self.check_order and did != self.ids[i]:
+            raise ContractViolation(f"item {i}: esperado id {self.ids[i]}, veio {did}")
+        bad = [d.get("name") for d in (item.get("drivers") or []) if isinstance(d, dict) and d.get("name") not in self.allowed]
+        if bad:
+            raise ContractViolation(f"item {i} ({did}): driver(s) fora das features permitidas: {bad}")
+        self.seen += 1
+
+class RankingScanner:
+    """Extrai itens completos do array 'ranking' de um JSON que ainda está chegando."""
+    _dec = json.JSONDecoder()
+
+    def __init__(self, on_item):
+        self.buf = ""
+        self.pos = None        # posição logo após '[' do ranking
+        self.on_item = on_item
+
+    def feed(self, text):
+        self.buf += text
+        if self.pos is None:
+            k = self.buf.find('"ranking"')
+            b = self.buf.find("[", k) if k >= 0 else -1
+            if b < 0:
+                return
+            self.pos = b + 1
+        n = len(self.buf)
+        while True:
+            p = self.pos
+            while p < n and self.buf[p] in " \t\r\n,":
+                p += 1
+            if p >= n or self.buf[p] == "]":
+                self.pos = p
+                return
+            try:
+                item, end = self._dec.raw_decode(self.buf, p)
+            except json.JSONDecodeError:
+                return         # objeto incompleto: espera o próximo pedaço
+            self.on_item(item)
+            self.pos = end
+
+def chat(url, req, timeout=300, validate=None, pool_size=4) -> dict:
+    """
+    POST no /api/chat e devolve o JSON de message.content. Com req['stream'] verdadeiro,
+    consome o NDJSON e chama `validate(item)` a cada item do ranking (aborta no 1º erro,
+    guardando em `ContractViolation.partial` os itens válidos já recebidos).
+    `timeout` vale para conectar e para o intervalo entre pedaços.
+    """
+    s = session(pool_size)
+    if not req.get("stream"):
+        r = s.post(url, json=req, timeout=timeout)
+        r.raise_for_status()
+        return json.loads(r.json()["message"]["content"])
+
+    parts, ok = [], []
+
+    def on_item(item):
+        validate(item)
+        ok.append(item)
+
+    scan = RankingScanner(on_item) if validate else None
+    with s.post(url, json=req, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            text = (chunk.get("message") or {}).get("content", "")
+            if text:
+                parts.append(text)
+                if scan:
+                    try:
+                        scan.feed(text)    # ContractViolation fecha a conexão ao sair do with
+                    except ContractViolation as e:
+                        e.partial = {"ranking": ok}
+                        raise
+            if chunk.get("done"):
+                break
+    try:
+        return json.loads("".join(parts))
+    except json.JSONDecodeError as e:
+        if not scan:
+            raise
+        cv = ContractViolation(f"JSON incompleto/inválido ao fim do stream ({e})")
+        cv.partial = {"ranking": ok}
+        raise cv
@@ -0,0 +1,79 @@
+# lod.py
+"""
+Níveis de detalhe (LOD) das geometrias de distrito para o front.
+
+Os distritos formam uma cobertura (polígonos que se tocam sem sobrepor). A
+simplificação polígono a polígono abriria frestas entre vizinhos; aqui a
+cobertura é simplificada de uma vez (shapely.coverage_simplify), de modo que
+cada aresta compartilhada é simplificada uma única vez e continua idêntica dos
+dois lados.
+
+Passos, todos vetorizados no array inteiro:
+  1. reprojeta para o UTM local (tolerâncias em metros);
+  2. coverage_clean: fecha frestas/sobreposições finas do dado de origem
+     (até `gap_m`), sem o que coverage_simplify não garante vizinhos colados;
+  3. coverage_simplify com a tolerância de cada LOD;
+  4. volta para EPSG:4326 e quantiza as coordenadas em `decimals` casas
+     (5 ≈ 1 m, 6 ≈ 0,1 m). O arredondamento é ponto a ponto: um vértice
+     compartilhado vira o mesmo ponto nos dois polígonos.
+
+Config (build.lods):
+    - {name: low, tolerance_m: 100, decimals: 5}
+Saída de cada LOD: <final_geojson>.<name>.geojson (ver lod_path).
+"""
+import os, re
+import numpy as np
+import shapely
+import geopandas as gpd
+
+NAME_RE = re.compile(r"^[a-z0-9_-]+$")   # nome do LOD vira parte do arquivo e da query (?lod=)
+
+def lod_path(path: str, name: str) -> str:
+    """out/distritos_front.geojson + 'low' -> out/distritos_front.low.geojson"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{name}{ext}"
+
+def parse_lods(spec) -> list:
+    """Lista de LODs do config, validada e ordenada do mais fino ao mais grosso."""
+    out = []
+    for d in spec or []:
+        name = str(d.get("name", "")).strip().lower()
+        if not NAME_RE.match(name) or name == "full":
+            raise ValueError(f"build.lods: nome de LOD inválido: {name!r}")
+        out.append({"name": name, "tolerance_m": float(d.get("tolerance_m", 0)),
+                    "decimals": int(d.get("decimals", 6))})
+    if len({d["name"] for d in out}) != len(out):
+        raise ValueError("build.lods: nomes repetidos")
+    return sorted(out, key=lambda d: d["tolerance_m"])
+
+def quantize(geoms, decimals: int):
+    """Arredonda as coordenadas (ponto a ponto) e remove vértices repetidos consecutivos."""
+    q = shapely.transform(np.asarray(geoms, dtype=object), lambda xy: np.round(xy, decimals))
+    return shapely.remove_repeated_points(q, 0.0)
+
+def clean_coverage(g: gpd.GeoDataFrame, gap_m: float = 10.0):
+    """Cobertura projetada (métrica) e sem frestas/sobreposições até gap_m; devolve (geoms, crs)."""
+    proj = g.geometry if g.crs.is_projected else g.geometry.to_crs(g.geometry.estimate_utm_crs())
+    geoms = shapely.coverage_clean(proj.values, gap_width=gap_m)
+    if not shapely.coverage_is_valid(geoms):
+        print(f"[lod] cobertura ainda inválida após coverage_clean(gap {gap_m} m); pode haver frestas")
+    return geoms, proj.crs
+
+def build_lods(g: gpd.GeoDataFrame, lods, gap_m: float = 10.0) -> dict:
+    """{nome: array de geometrias em 4326} para cada LOD, na mesma ordem de g."""
+    if not lods:
+        return {}
+    base, crs = clean_coverage(g, gap_m)
+    out = {}
+    for d in lods:
+        simp = shapely.coverage_simplify(base, d["tolerance_m"]) if d["tolerance_m"] > 0 else base
+        geo = gpd.GeoSeries(simp, crs=crs).to_crs(4326).values
+        q = quantize(geo, d["decimals"])
+        bad = int((~shapely.is_valid(q)).sum())
+        ok = shapely.coverage_is_valid(q)
+        print(f"[lod] {d['name']}: tolerância {d['tolerance_m']:g} m, {d['decimals']} casas → "
+              f"{int(shapely.get_num_coordinates(q).sum())} vértices"
+              + ("" if ok else " | cobertura com frestas/sobreposições")
+              + (f" | {bad} geometria(s) inválida(s)" if bad else ""))
+        out[d["name"]] = q
+    return out
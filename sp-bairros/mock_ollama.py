@@ -0,0 +1,172 @@
+# mock_ollama.py
+"""
+Substituto local do /api/chat do Ollama para testes e benchmark do ranking.
+
+Responde no mesmo formato do Ollama (stream false: um JSON; stream true: NDJSON
+com message.content em pedaços e "done": true no fim). O llm_score é a média das
+features 'bad' (ideb_good invertido) + ruído, e os drivers as 3 maiores — uma
+resposta plausível, não um modelo.
+
+Latência e vazão simuladas:
+  latency  — segundos até o 1º token
+  tps      — tokens/s de geração (≈ 4 caracteres por token)
+Modos de falha (probabilidade por requisição, sorteados com `seed`):
+  short      — devolve só parte do ranking
+  bad_feature — um driver com nome fora das features permitidas
+  malformed  — JSON truncado
+  timeout    — fica parado `hang` segundos antes de responder
+  http_error — HTTP 500
+
+Uso:
+    python mock_ollama.py --port 11434 --latency 0.2 --tps 2000 --fail short=0.1,malformed=0.05
+"""
+import sys, json, time, random, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAILURES = ("short", "bad_feature", "malformed", "timeout", "http_error")
+CHARS_PER_TOKEN = 4
+
+class MockConfig:
+    def __init__(self, latency=0.0, tps=0.0, fail=None, hang=30.0, chunk_chars=64, seed=0):
+        self.latency = latency
+        self.tps = tps                      # 0 = sem limite
+        self.fail = dict(fail or {})
+        self.hang = hang
+        self.chunk_chars = chunk_chars
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = {k: 0 for k in FAILURES}
+
+    def draw(self) -> str:
+        """Sorteia o modo de falha desta requisição (ou '' = resposta correta)."""
+        with self.lock:
+            self.requests += 1
+            for mode in FAILURES:
+                if self.rng.random() < float(self.fail.get(mode, 0)):
+                    self.failures[mode] += 1
+                    return mode
+            return ""
+
+def parse_fail(spec: str) -> dict:
+    """'short=0.1,malformed=0.05' -> {'short': 0.1, 'malformed': 0.05}"""
+    out = {}
+    for part in filter(None, (spec or "").split(",")):
+        k, _, v = part.partition("=")
+        if k.strip() not in FAILURES:
+            raise ValueError(f"modo de falha desconhecido: {k!r} (use {', '.join(FAILURES)})")
+        out[k.strip()] = float(v or 1)
+    return out
+
+def _allowed(fmt) -> list:
+    try:
+        return fmt["properties"]["ranking"]["items"]["properties"]["drivers"]["items"]["properties"]["name"]["enum"]
+    except (KeyError, TypeError):
+        return []
+
+def fake_ranking(distritos, allowed, rng) -> dict:
+    rows = []
+    for d in distritos:
+        nv = d.get("norm", {})
+        bad = {f: (1 - float(nv.get(f, 0))) if f == "ideb_good" else float(nv.get(f, 0)) for f in allowed}
+        s = sum(bad.values()) / max(1, len(bad)) + rng.uniform(-0.03, 0.03)
+        top = sorted(bad, key=bad.get, reverse=True)[:3]
+        rows.append({"id": str(d["id"]), "rank": 0, "llm_score": round(min(1, max(0, s)), 4), "tier": "médio",
+                     "drivers": [{"name": f, "direction": "up", "contribution": round(bad[f], 4)} for f in top],
+                     "explanation": f"{d.get('name', d['id'])}: pior em {top[0] if top else '-'}"})
+    for r, row in enumerate(sorted(rows, key=lambda x: -x["llm_score"]), 1):
+        row["rank"] = r
+    return {"ranking": rows}
+
+def make_handler(cfg: MockConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def _send(self, code, body: bytes, ctype="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _chunk(self, b: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(b), b))
+            self.wfile.flush()
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/api/chat":
+                return self._send(404, b'{"error":"not found"}')
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            mode = cfg.draw()
+            if mode == "http_error":
+                return self._send(500, b'{"error":"mock: falha simulada"}')
+            if mode == "timeout":
+                time.sleep(cfg.hang)
+
+            distritos = json.loads(req["messages"][-1]["content"]).get("distritos", [])
+            with cfg.lock:
+                out = fake_ranking(distritos, _allowed(req.get("format")), cfg.rng)
+                if mode == "short" and out["ranking"]:
+                    out["ranking"] = out["ranking"][: cfg.rng.randint(0, len(out["ranking"]) - 1)]
+                if mode == "bad_feature" and out["ranking"]:
+                    out["ranking"][cfg.rng.randrange(len(out["ranking"]))]["drivers"][0]["name"] = "Sé"
+            text = json.dumps(out, ensure_ascii=False)
+            if mode == "malformed":
+                text = text[: len(text) // 2]
+
+            time.sleep(cfg.latency)
+            per_char = 1.0 / (cfg.tps * CHARS_PER_TOKEN) if cfg.tps else 0.0
+            msg = lambda content, done: (json.dumps({"model": req.get("model"), "message": {"role": "assistant", "content": content},
+                                                     "done": done}, ensure_ascii=False) + "\n").encode("utf-8")
+            try:
+                if not req.get("stream", True):       # o Ollama faz stream por padrão
+                    time.sleep(len(text) * per_char)
+                    return self._send(200, msg(text, True))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(0, len(text), cfg.chunk_chars):
+                    piece = text[i:i + cfg.chunk_chars]
+                    time.sleep(len(piece) * per_char)
+                    self._chunk(msg(piece, False))
+                self._chunk(msg("", True))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass                                    # cliente abortou (validação no stream)
+    return Handler
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return                                      # cliente fechou a conexão keep-alive
+        super().handle_error(request, client_address)
+
+def start(cfg: MockConfig, host="127.0.0.1", port=0):
+    """Sobe o mock numa thread daemon; devolve (server, url do /api/chat)."""
+    srv = MockServer((host, port), make_handler(cfg))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://{host}:{srv.server_address[1]}/api/chat"
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mock local do /api/chat do Ollama.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--latency", type=float, default=0.0, help="s até o 1º token")
+    ap.add_argument("--tps", type=float, default=0.0, help="tokens/s (0 = sem limite)")
+    ap.add_argument("--fail", default="", help="ex.: short=0.1,bad_feature=0.05,malformed=0.05,timeout=0.02,http_error=0.02")
+    ap.add_argument("--hang", type=float, default=30.0, help="s parado no modo timeout")
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    cfg = MockConfig(a.latency, a.tps, parse_fail(a.fail), a.hang, seed=a.seed)
+    srv = MockServer((a.host, a.port), make_handler(cfg))
+    print(f"[mock] /api/chat em http://{a.host}:{a.port} (latência {a.latency}s, {a.tps or '∞'} tok/s, falhas {cfg.fail or '-'})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,150 @@
+# mvt.py
+"""
+Codificador mínimo de Mapbox Vector Tile (spec 2.1) e matemática de tiles XYZ.
+
+Só o que o mapa de distritos precisa: uma camada de polígonos com properties
+simples (texto, número, inteiro). O protobuf é escrito à mão (varint + campos
+length-delimited); não depende de mapbox-vector-tile/protobuf.
+
+As geometrias chegam já em coordenadas do tile (0..extent, y para baixo),
+recortadas, inteiras e orientadas (anel externo com área positiva na fórmula
+do agrimensor nesse sistema, buracos negativa). tile_coords() faz esse preparo
+a partir de Web Mercator (EPSG:3857).
+"""
+import math, struct
+import numpy as np
+import shapely
+
+ORIGIN = 20037508.342789244        # meia-volta do Web Mercator, em metros
+EARTH_RES = 2 * ORIGIN / 256       # m/px no z0 (tile de 256 px) no equador
+
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POLYGON = 3
+
+# ---------- tiles XYZ ----------
+def lonlat_to_tile(lon: float, lat: float, z: int) -> tuple:
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_r = math.radians(max(-85.05112878, min(85.05112878, lat)))
+    y = int((1.0 - math.asinh(math.tan(lat_r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_range(bounds, z: int) -> tuple:
+    """(x0, y0, x1, y1) inclusivos dos tiles que cobrem bounds=(minlon, minlat, maxlon, maxlat)."""
+    x0, y0 = lonlat_to_tile(bounds[0], bounds[3], z)
+    x1, y1 = lonlat_to_tile(bounds[2], bounds[1], z)
+    return x0, y0, x1, y1
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """Bounds do tile em EPSG:3857 (minx, miny, maxx, maxy)."""
+    size = 2 * ORIGIN / 2 ** z
+    minx = -ORIGIN + x * size
+    maxy = ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def ground_resolution(lat: float, z: int) -> float:
+    """Metros por pixel (tile de 256 px) na latitude lat."""
+    return EARTH_RES * math.cos(math.radians(lat)) / 2 ** z
+
+def tile_coords(geoms, z, x, y, extent=4096, buffer=64):
+    """
+    Recorta (bbox do tile + buffer) geometrias em 3857 e leva para a grade inteira
+    do tile; devolve o array com vazias onde nada sobra.
+    """
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    pad = (maxx - minx) * buffer / extent
+    clipped = shapely.clip_by_rect(geoms, minx - pad, miny - pad, maxx + pad, maxy + pad)
+    sx = extent / (maxx - minx)
+    local = shapely.transform(clipped, lambda c: np.column_stack([(c[:, 0] - minx) * sx, (maxy - c[:, 1]) * sx]))
+    # grade inteira com saída válida (anéis que colapsam somem); y invertido: CCW aritmético = área positiva
+    return shapely.orient_polygons(shapely.set_precision(local, 1.0), exterior_cw=False)
+
+# ---------- protobuf ----------
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+def _key(field: int, wire: int) -> bytes:
+    return _varint(field << 3 | wire)
+
+def _ld(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+def _packed(field: int, ints) -> bytes:
+    return _ld(field, b"".join(map(_varint, ints)))
+
+def _zigzag(a: np.ndarray) -> np.ndarray:
+    return (a << 1) ^ (a >> 63)
+
+def _value(v) -> bytes:
+    if isinstance(v, str):
+        return _ld(1, v.encode("utf-8"))
+    if isinstance(v, (bool, np.bool_)):
+        return _key(7, 0) + _varint(int(v))
+    if isinstance(v, (int, np.integer)):
+        v = int(v)
+        return _key(5, 0) + _varint(v) if v >= 0 else _key(6, 0) + _varint((v << 1) ^ (v >> 63))
+    return _key(3, 1) + struct.pack("<d", float(v))
+
+# ---------- geometria ----------
+def _ring_commands(coords: np.ndarray, cursor: np.ndarray, out: list) -> np.ndarray:
+    """MoveTo + LineTo(n-1) + ClosePath de um anel (sem o ponto de fechamento); devolve o novo cursor."""
+    pts = coords[:-1].astype(np.int64)
+    if len(pts):
+        keep = np.ones(len(pts), dtype=bool)
+        keep[1:] = np.any(pts[1:] != pts[:-1], axis=1)      # LineTo de comprimento zero é proibido
+        pts = pts[keep]
+    if len(pts) < 3:
+        return cursor
+    deltas = _zigzag(np.diff(np.vstack([cursor, pts]), axis=0))
+    out.append(MOVE_TO | 1 << 3)
+    out.extend(deltas[0].tolist())
+    out.append(LINE_TO | (len(pts) - 1) << 3)
+    out.extend(deltas[1:].ravel().tolist())
+    out.append(CLOSE_PATH | 1 << 3)
+    return pts[-1]
+
+def polygon_commands(geom) -> list:
+    """Inteiros de comando da geometria (Polygon/MultiPolygon) já em coordenadas do tile."""
+    out, cursor = [], np.zeros(2, dtype=np.int64)
+    for poly in getattr(geom, "geoms", [geom]):
+        if poly.is_empty or poly.geom_type != "Polygon":
+            continue
+        cursor = _ring_commands(shapely.get_coordinates(poly.exterior), cursor, out)
+        for ring in poly.interiors:
+            cursor = _ring_commands(shapely.get_coordinates(ring), cursor, out)
+    return out
+
+# ---------- camada / tile ----------
+def encode_tile(layer: str, features, extent=4096) -> bytes:
+    """
+    Tile com uma camada de polígonos. features: iterável de (id inteiro ou None,
+    geometria em coordenadas do tile, dict de properties). Devolve b'' se nada sobrar.
+    """
+    keys, values, feats = {}, {}, []
+    for fid, geom, props in features:
+        cmds = polygon_commands(geom)
+        if not cmds:
+            continue
+        tags = []
+        for k, v in props.items():
+            if v is None or (isinstance(v, float) and math.isnan(v)):
+                continue
+            vb = _value(v)
+            tags += [keys.setdefault(k, len(keys)), values.setdefault(vb, len(values))]
+        f = (_key(1, 0) + _varint(int(fid)) if fid is not None else b"") + (_packed(2, tags) if tags else b"")
+        feats.append(_ld(2, f + _key(3, 0) + _varint(POLYGON) + _packed(4, cmds)))
+    if not feats:
+        return b""
+    body = (_key(15, 0) + _varint(2) + _ld(1, layer.encode("utf-8")) + b"".join(feats)
+            + b"".join(_ld(3, k.encode("utf-8")) for k in keys)
+            + b"".join(_ld(4, v) for v in values)
+            + _key(5, 0) + _varint(extent))
+    return _ld(3, body)
@@ -0,0 +1,135 @@
+# names.py
+"""
+Normalização de nomes de lugares (join distrito <-> Mapa e afins).
+
+- norm_str: forma canônica de um nome (memoizada; nomes se repetem muito).
+- norm_series: aplica norm_str + NAME_OVERRIDES numa Series inteira, calculando
+  só os valores distintos e expandindo pelos códigos (pd.factorize).
+- NgramIndex: índice de trigramas de caracteres sobre os nomes canônicos; resolve
+  nomes sem match acima de um limiar de similaridade (Dice) e grava as sugestões
+  num relatório para virar NAME_OVERRIDES.
+"""
+import os, re, json, unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# mapeamentos de nomes “sem acento/variante” -> forma oficial normalizada (também sem acento)
+NAME_OVERRIDES = {
+    "republica": "republica",          # REPÚBLICA
+    "se": "se",                        # SÉ
+    "saude": "saude",                  # SAÚDE
+    "agua-rasa": "agua-rasa",          # ÁGUA RASA
+    "freguesia-do-o": "freguesia-do-o",# FREGUESIA DO Ó
+    "vila-curuca": "vila-curuca",      # VILA CURUÇÁ
+    "sao-domingos": "sao-domingos",
+    "sao-lucas": "sao-lucas",
+    "sao-mateus": "sao-mateus",
+    "sao-miguel": "sao-miguel",
+    "sao-rafael": "sao-rafael",
+    # adicione aqui novos casos encontrados no log de faltantes / relatório de sugestões
+}
+
+_RE_SEP  = re.compile(r"[^a-z0-9]+")
+_RE_DASH = re.compile(r"-+")
+
+@lru_cache(maxsize=65536)
+def norm_str(s: str) -> str:
+    """Normaliza nomes para join: minúsculas, sem acento, separadores como '-'."""
+    s = str(s).strip().lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))  # remove acentos
+    s = s.replace("'", "").replace("`","").replace("´","")
+    s = s.replace("–","-").replace("—","-")
+    s = _RE_SEP.sub("-", s)
+    s = _RE_DASH.sub("-", s).strip("-")
+    return s
+
+def norm_series(s: pd.Series, overrides=NAME_OVERRIDES) -> pd.Series:
+    """norm_str + overrides na Series toda; cada valor distinto é normalizado uma vez."""
+    codes, uniq = pd.factorize(s, use_na_sentinel=False)
+    normed = np.array([overrides.get(k, k) for k in (norm_str(str(v)) for v in uniq)], dtype=object)
+    return pd.Series(normed[codes], index=s.index, dtype=object)
+
+# =================== n-gramas ===================
+
+def _ngrams(s: str, n=3) -> Counter:
+    s = f"  {s} "     # padding: realça início/fim da palavra
+    return Counter(s[i:i+n] for i in range(len(s) - n + 1))
+
+class NgramIndex:
+    """Índice invertido de n-gramas de caractere sobre nomes canônicos (já normalizados)."""
+
+    def __init__(self, names, n=3):
+        self.n = n
+        self.names = list(dict.fromkeys(str(x) for x in names if isinstance(x, str) and x))
+        self.grams = [_ngrams(x, n) for x in self.names]
+        self.sizes = [sum(g.values()) for g in self.grams]
+        self.inv = defaultdict(list)
+        for i, g in enumerate(self.grams):
+            for t, c in g.items():
+                self.inv[t].append((i, c))
+
+    def best(self, q: str):
+        """(nome canônico, similaridade Dice 0..1) mais próximo de `q`, ou (None, 0.0)."""
+        g = _ngrams(q, self.n)
+        shared = Counter()
+        for t, c in g.items():
+            for i, ci in self.inv.get(t, ()):
+                shared[i] += min(c, ci)
+        if not shared:
+            return None, 0.0
+        qs = sum(g.values())
+        i, sc = max(((i, 2.0 * k / (qs + self.sizes[i])) for i, k in shared.items()), key=lambda t: (t[1], -t[0]))
+        return self.names[i], sc
+
+def resolve_misses(keys: pd.Series, canonical: pd.Series, threshold=0.8, report_path=None) -> dict:
+    """
+    Para cada chave normalizada de `keys` que não existe em `canonical`, procura o
+    nome canônico mais parecido. Devolve {chave: canônico} só para as que passam do
+    limiar e cujo alvo fica com uma única chave: alvo que já casa exatamente com
+    outra chave, ou disputado por várias (vence só a de maior score, sem empate), é
+    rejeitado — senão dois distritos se fundiriam em silêncio no join. Todas as
+    sugestões (aplicadas ou não, com o motivo da rejeição) vão para `report_path`
+    (JSON), regravado a cada execução, inclusive sem nenhum miss.
+    """
+    canon = set(canonical.dropna().astype(str))
+    present = set(keys.dropna().astype(str))
+    misses = sorted(k for k in present if k not in canon)
+    rows, auto = [], {}
+    if misses:
+        idx = NgramIndex(sorted(canon))
+        best = {m: idx.best(m) for m in misses}
+        claims = {}
+        for m, (sug, sc) in best.items():
+            if sug is not None and sc >= threshold:
+                claims.setdefault(sug, []).append((sc, m))
+        for m, (sug, sc) in best.items():
+            rejected = None
+            if sug is None or sc < threshold:
+                pass
+            elif sug in present:
+                rejected = "alvo já casa exatamente com outra chave"
+            else:
+                top = max(c for c, _ in claims[sug])
+                if sc < top or sum(c == top for c, _ in claims[sug]) > 1:
+                    rejected = "alvo disputado por outra chave"
+            applied = sug is not None and sc >= threshold and rejected is None
+            if applied:
+                auto[m] = sug
+            rows.append({"name": m, "suggestion": sug, "score": round(sc, 4), "applied": applied,
+                         **({"rejected": rejected} if rejected else {})})
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"threshold": threshold, "misses": rows,
+                       "suggested_overrides": {r["name"]: r["suggestion"] for r in rows if r["suggestion"]}},
+                      f, ensure_ascii=False, indent=2)
+    if not misses:
+        return {}
+    n_rej = sum("rejected" in r for r in rows)
+    print(f"[names] {len(misses)} nome(s) sem match; {len(auto)} resolvido(s) por n-grama (≥{threshold})"
+          + (f"; {n_rej} rejeitado(s) por alvo repetido" if n_rej else "")
+          + (f" | relatório: {report_path}" if report_path else ""))
+    return auto
@@ -0,0 +1,187 @@
+# pipeline.py
+"""
+Runner do pipeline com manifesto de estágios.
+
+Para cada estágio (etl -> rank -> build -> tiles -> cdn) calcula um fingerprint com:
+  - hash dos arquivos de entrada,
+  - a fatia do config.yaml que o estágio lê,
+  - hash do código (script + módulos que ele importa).
+Se o fingerprint bate com o da última execução bem-sucedida e as saídas ainda
+existem intactas, o estágio é pulado. O manifesto fica em out/pipeline_manifest.json.
+
+Uso:
+    python pipeline.py                 # todos os estágios
+    python pipeline.py rank build      # só alguns (na ordem do pipeline)
+    python pipeline.py --force etl     # ignora o manifesto para os estágios pedidos
+    python pipeline.py --dry-run       # só mostra o que rodaria
+"""
+import os, sys, json, time, hashlib, argparse, subprocess
+import yaml
+
+from ingest import atomic_write, file_sha256
+
+CONFIG = os.environ.get("SP_CONFIG", "config.yaml")
+MANIFEST = "out/pipeline_manifest.json"
+
+def stages(cfg) -> list:
+    """Declaração dos estágios: entradas, fatias de config (caminhos com '.'), código e saídas."""
+    inp, out = cfg["inputs"], cfg["outputs"]
+    norm_pq = out.get("norm_parquet", "out/norm_features.parquet")
+    build = cfg.get("build") or {}
+    stem, ext = os.path.splitext(out["final_geojson"])
+    lods = [f"{stem}.{d['name']}{ext}" for d in build.get("lods") or []]    # lod.lod_path
+    fcs = [out["final_geojson"]] + lods
+    if out.get("geom_geojson"):                                  # geometria separada (+ LODs) e tabela de atributos
+        gstem, gext = os.path.splitext(out["geom_geojson"])
+        fcs += [out["geom_geojson"]] + [f"{gstem}.{d['name']}{gext}" for d in build.get("lods") or []]
+    if out.get("attrs_json"):
+        fcs.append(out["attrs_json"])
+    suffix = {"br": ".br", "gzip": ".gz", "zstd": ".zst"}        # fc_writer.SUFFIX
+    fc_pre = [fc + suffix[e] for fc in fcs for e in build.get("precompress", ["br", "gzip"]) if e in suffix]
+    cdn = [os.path.join("out/cdn_cache", os.path.basename(fc)) for fc in fcs]
+    return [
+        {
+            "name": "etl",
+            "cmd": ["etl_sp_capital.py"],
+            "inputs": [inp["distritos_geojson"], inp["inep_csv"], inp["ideb_csv"], inp["mapa_ods"]],
+            "config": ["inputs", "schema", "etl", "outputs.agg_parquet", "outputs.norm_json",
+                       "outputs.norm_parquet", "outputs.cache_dir", "outputs.geo_store"],
+            "code": ["etl_sp_capital.py", "aggregation.py", "ingest.py", "geo_assign.py", "names.py", "artifacts.py",
+                     "geostore.py", "profiling.py"],
+            "outputs": [out["agg_parquet"], out["norm_json"], norm_pq],
+        },
+        {
+            "name": "rank",
+            "cmd": ["ranking.py"],
+            "inputs": [out["norm_json"], norm_pq],
+            "config": ["llm", "scoring", "outputs.norm_json", "outputs.norm_parquet", "outputs.rank_json"],
+            "code": ["ranking.py", "artifacts.py", "llm_cache.py", "llm_client.py", "scoring.py", "contract.py"],
+            "outputs": [out["rank_json"], os.path.splitext(out["rank_json"])[0] + ".inputs.parquet"],
+        },
+        {
+            "name": "build",
+            "cmd": ["build_featurecollection.py"],
+            "inputs": [inp["distritos_geojson"], out["norm_json"], norm_pq, out["rank_json"], out["agg_parquet"]],
+            "config": ["inputs.distritos_geojson", "inputs.distritos_crs", "outputs.norm_json", "outputs.norm_parquet",
+                       "outputs.rank_json", "outputs.agg_parquet", "outputs.final_geojson", "outputs.geo_store",
+                       "outputs.geom_geojson", "outputs.attrs_json", "build"],
+            "code": ["build_featurecollection.py", "artifacts.py", "fc_writer.py", "lod.py", "geostore.py", "names.py",
+                     "ingest.py"],
+            "outputs": fcs + fc_pre,
+        },
+        {
+            "name": "tiles",
+            "cmd": ["build_tiles.py"],
+            "inputs": [inp["distritos_geojson"], out["rank_json"]],
+            "config": ["inputs.distritos_geojson", "inputs.distritos_crs", "outputs.rank_json", "outputs.geo_store",
+                       "outputs.tiles_mbtiles", "build.coverage_gap_m", "tiles"],
+            "code": ["build_tiles.py", "mvt.py", "lod.py", "build_featurecollection.py", "artifacts.py", "fc_writer.py",
+                     "geostore.py", "names.py", "ingest.py"],
+            "outputs": [out.get("tiles_mbtiles", "out/distritos.mbtiles")],
+        },
+        {
+            "name": "cdn",
+            "cmd": ["server.py", "--build-cache"],
+            "inputs": fcs + fc_pre,
+            "config": ["outputs.final_geojson", "outputs.geom_geojson", "outputs.attrs_json", "outputs.tiles_mbtiles",
+                       "build.lods"],
+            "code": ["server.py"],
+            "outputs": cdn + [c + sfx for c in cdn for sfx in (".br", ".gz", ".zst")]
+                       + [os.path.splitext(c)[0] + ".etag" for c in cdn],
+        },
+    ]
+
+# =================== fingerprint ===================
+
+def _cfg_get(cfg, dotted):
+    cur = cfg
+    for k in dotted.split("."):
+        if not isinstance(cur, dict) or k not in cur:
+            return None
+        cur = cur[k]
+    return cur
+
+def _files_hash(paths) -> dict:
+    """{caminho: sha256} (ou None se não existir) na ordem declarada."""
+    return {p: (file_sha256(p) if os.path.exists(p) else None) for p in paths}
+
+def fingerprint(stage, cfg) -> str:
+    h = hashlib.sha256()
+    payload = {
+        "inputs": _files_hash(stage["inputs"]),
+        "config": {k: _cfg_get(cfg, k) for k in stage["config"]},
+        "code":   _files_hash(stage["code"]),
+        "cmd":    stage["cmd"],
+    }
+    h.update(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+def load_manifest(path=MANIFEST) -> dict:
+    try:
+        return json.load(open(path, "r", encoding="utf-8"))
+    except Exception:
+        return {}
+
+def _dump_json(tmp, m: dict):
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(m, f, ensure_ascii=False, indent=2)
+
+def save_manifest(m: dict, path=MANIFEST):
+    atomic_write(path, lambda tmp: _dump_json(tmp, m))
+
+def is_fresh(stage, fp, manifest) -> bool:
+    """Fingerprint igual ao último sucesso + saídas presentes e com o mesmo hash gravado."""
+    prev = manifest.get(stage["name"])
+    if not prev or prev.get("fingerprint") != fp:
+        return False
+    return _files_hash(stage["outputs"]) == prev.get("outputs")
+
+# =================== execução ===================
+
+def run(selected=None, force=False, dry_run=False, config=CONFIG) -> list:
+    cfg = yaml.safe_load(open(config, "r", encoding="utf-8"))
+    manifest = load_manifest()
+    report = []
+    for st in stages(cfg):
+        if selected and st["name"] not in selected:
+            continue
+        fp = fingerprint(st, cfg)
+        if not force and is_fresh(st, fp, manifest):
+            print(f"[pipeline] {st['name']}: reaproveitado (fingerprint {fp[:12]}, de {manifest[st['name']]['finished_at']})")
+            report.append((st["name"], "reaproveitado", 0.0))
+            continue
+        if dry_run:
+            print(f"[pipeline] {st['name']}: rodaria (fingerprint {fp[:12]})")
+            report.append((st["name"], "pendente", 0.0))
+            continue
+
+        print(f"[pipeline] {st['name']}: executando {' '.join(st['cmd'])}")
+        t0 = time.perf_counter()
+        # os estágios leem o config de SP_CONFIG: o fingerprint e a execução usam o mesmo arquivo
+        rc = subprocess.call([sys.executable] + st["cmd"], env={**os.environ, "SP_CONFIG": config})
+        dt = time.perf_counter() - t0
+        if rc != 0:
+            print(f"[pipeline] {st['name']}: FALHOU (código {rc}) após {dt:.1f}s")
+            report.append((st["name"], "falhou", dt))
+            break
+        manifest[st["name"]] = {
+            "fingerprint": fp,
+            "outputs": _files_hash(st["outputs"]),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": round(dt, 3),
+        }
+        save_manifest(manifest)
+        report.append((st["name"], "executado", dt))
+
+    print("[pipeline] resumo: " + " | ".join(f"{n}={s}" + (f" ({dt:.1f}s)" if dt else "") for n, s, dt in report))
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Roda o pipeline pulando estágios inalterados.")
+    ap.add_argument("stages", nargs="*", help="subconjunto de estágios (etl, rank, build, tiles, cdn)")
+    ap.add_argument("--force", action="store_true", help="ignora o manifesto")
+    ap.add_argument("--dry-run", action="store_true", help="só mostra o que rodaria")
+    ap.add_argument("--config", default=CONFIG)
+    a = ap.parse_args()
+    rep = run(a.stages or None, force=a.force, dry_run=a.dry_run, config=a.config)
+    sys.exit(1 if any(s == "falhou" for _, s, _ in rep) else 0)
@@ -0,0 +1,98 @@
+# profiling.py
+"""
+Instrumentação por estágio (tempo de parede, CPU, memória, linhas).
+
+    prof = Profiler(tracemalloc_on=False, cprofile_stage="spatial join")
+    with prof.stage("load INEP") as st:
+        inep = ...
+        st.rows = len(inep)
+    prof.dump("out/etl_profile.json")
+
+Memória:
+  - peak_rss_mb:   pico de RSS do processo até o fim do estágio (getrusage; high-water mark)
+  - rss_growth_mb: quanto esse pico subiu durante o estágio
+  - py_peak_mb:    pico de alocações Python no estágio (tracemalloc; só se ligado, custa desempenho)
+"""
+import os, sys, json, time, cProfile, tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:          # Windows
+    resource = None
+
+def _maxrss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux devolve KiB; macOS devolve bytes
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+class StageRecord:
+    __slots__ = ("name", "rows", "wall_s", "cpu_s", "peak_rss_mb", "rss_growth_mb", "py_peak_mb")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.wall_s = self.cpu_s = self.peak_rss_mb = self.rss_growth_mb = self.py_peak_mb = None
+
+    def to_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in self.__slots__}
+        return {k: (round(v, 4) if isinstance(v, float) else v) for k, v in d.items() if v is not None}
+
+class Profiler:
+    def __init__(self, tracemalloc_on=False, cprofile_stage=None, cprofile_path=None):
+        self.records = []
+        self.tracemalloc_on = tracemalloc_on
+        self.cprofile_stage = cprofile_stage
+        self.cprofile_path = cprofile_path
+        self.t0 = time.perf_counter()
+        self.c0 = time.process_time()
+        if tracemalloc_on and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        rec = StageRecord(name)
+        rss0 = _maxrss_mb()
+        if self.tracemalloc_on:
+            tracemalloc.reset_peak()
+        prof = cProfile.Profile() if name == self.cprofile_stage else None
+        w0, c0 = time.perf_counter(), time.process_time()
+        if prof:
+            prof.enable()
+        try:
+            yield rec
+        finally:
+            if prof:
+                prof.disable()
+            rec.wall_s = time.perf_counter() - w0
+            rec.cpu_s = time.process_time() - c0
+            rec.peak_rss_mb = _maxrss_mb()
+            rec.rss_growth_mb = rec.peak_rss_mb - rss0
+            if self.tracemalloc_on:
+                rec.py_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            if prof:
+                path = self.cprofile_path or "out/etl_profile.prof"
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                prof.dump_stats(path)
+                print(f"[prof] cProfile de '{name}': {path} (veja com: python -m pstats {path})")
+            self.records.append(rec)
+
+    def summary(self) -> dict:
+        return {
+            "total": {"wall_s": round(time.perf_counter() - self.t0, 4),
+                      "cpu_s": round(time.process_time() - self.c0, 4),
+                      "peak_rss_mb": round(_maxrss_mb(), 4)},
+            "stages": [r.to_dict() for r in self.records],
+        }
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        s = self.summary()
+        s["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(s, f, ensure_ascii=False, indent=2)
+        slow = max(self.records, key=lambda r: r.wall_s, default=None)
+        print(f"[prof] perfil por estágio: {path} (total {s['total']['wall_s']:.2f}s"
+              + (f"; mais lento: {slow.name} {slow.wall_s:.2f}s)" if slow else ")"))
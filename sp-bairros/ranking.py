@@ -1,89 +1,115 @@
-import json, yaml, requests, numpy as np, pandas as pd, time
+import os, sys, json, yaml, hashlib, numpy as np, pandas as pd, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-cfg = yaml.safe_load(open("config.yaml","r",encoding="utf-8"))
+from artifacts import feature_cols, norm_items, read_norm
+from contract import Checker, ContractStats
+from llm_cache import ResponseCache, request_key
+from llm_client import ContractViolation, RankingValidator, chat
+from scoring import ScoreSpec, rank_frame, score
+
+CONFIG = os.environ.get("SP_CONFIG", "config.yaml")   # pipeline.py --config repassa o caminho
+cfg = yaml.safe_load(open(CONFIG, "r", encoding="utf-8"))
 LLM = cfg["llm"]
 IN_NORM = cfg["outputs"]["norm_json"]
+IN_NORM_PQ = cfg["outputs"].get("norm_parquet")
 OUT_RANK = cfg["outputs"]["rank_json"]
+# entradas normalizadas usadas no último ranking (base do modo incremental)
+OUT_RANK_INPUTS = os.path.splitext(OUT_RANK)[0] + ".inputs.parquet"
+# métricas de contrato das respostas do LLM nesta execução
+OUT_CONTRACT = os.path.splitext(OUT_RANK)[0] + ".contract.json"
+CACHE_CFG = LLM.get("cache") or {}
+RETRY = LLM.get("retry") or {}
+SCORING = cfg.get("scoring") or {}
 
-# Carrega o pacote para o LLM
-payload_in = json.load(open(IN_NORM,"r",encoding="utf-8"))
-items = payload_in.get("distritos", [])
-N = len(items)
-
-if N == 0:
-    raise SystemExit("[erro] norm_for_llm.json não tem distritos.")
+# cache de respostas (None = desligado; montado em main())
+CACHE = None
+CONTRACT = ContractStats()
 
 # Features permitidas (devem existir no 'norm' de cada item)
 # ideb_good é opcional; vamos detectar dinamicamente
 base_features = ["marginalidade","schools_total_bad","share_municipal_bad","share_estadual_bad","acesso_creche_bad"]
-has_ideb = any("ideb_good" in it.get("norm", {}) for it in items)
-allowed_features = base_features + (["ideb_good"] if has_ideb else [])
-
-# Schema rígido para saída do LLM
-LLM_SCHEMA = {
-  "type":"object",
-  "required":["ranking"],
-  "properties":{
-    "ranking":{
-      "type":"array",
-      "minItems": N,
-      "maxItems": N,
-      "items":{
-        "type":"object",
-        "required":["id","rank","llm_score","tier","drivers","explanation"],
-        "properties":{
-          "id":{"type":"string"},
-          "rank":{"type":"integer","minimum":1},
-          "llm_score":{"type":"number","minimum":0,"maximum":1},
-          "tier":{"type":"string","enum":["muito alto","alto","médio","baixo","muito baixo"]},
-          "drivers":{
-            "type":"array",
-            "minItems": 3,
-            "maxItems": 3,
-            "items":{
-              "type":"object",
-              "required":["name","direction","contribution"],
-              "properties":{
-                "name":{"type":"string","enum": allowed_features},
-                "direction":{"type":"string","enum":["up","down"]},
-                "contribution":{"type":"number"}
-              }
+
+TIERS = ["muito alto","alto","médio","baixo","muito baixo"]
+
+def make_schema(n, allowed_features):
+    """Schema rígido para saída do LLM (exatamente n itens)."""
+    return {
+      "type":"object",
+      "required":["ranking"],
+      "properties":{
+        "ranking":{
+          "type":"array",
+          "minItems": n,
+          "maxItems": n,
+          "items":{
+            "type":"object",
+            "required":["id","rank","llm_score","tier","drivers","explanation"],
+            "properties":{
+              "id":{"type":"string"},
+              "rank":{"type":"integer","minimum":1},
+              "llm_score":{"type":"number","minimum":0,"maximum":1},
+              "tier":{"type":"string","enum":TIERS},
+              "drivers":{
+                "type":"array",
+                "minItems": 3,
+                "maxItems": 3,
+                "items":{
+                  "type":"object",
+                  "required":["name","direction","contribution"],
+                  "properties":{
+                    "name":{"type":"string","enum": allowed_features},
+                    "direction":{"type":"string","enum":["up","down"]},
+                    "contribution":{"type":"number"}
+                  }
+                }
+              },
+              "explanation":{"type":"string"}
             }
-          },
-          "explanation":{"type":"string"}
+          }
         }
       }
     }
-  }
-}
-
-# Prompt extremamente explícito
-SYSTEM = (
-  "Você é um avaliador técnico. Recebe uma lista de distritos com indicadores normalizados em 'norm'. "
-  "Há exatamente {N} distritos de entrada, e você deve devolver um array 'ranking' COM EXATAMENTE {N} ITENS "
-  "(um por distrito), NA MESMA ORDEM DOS 'id' de entrada. "
-  "Regras dos indicadores (valem para TODOS os distritos):\n"
-  "- 'marginalidade': 1=pior (mais vulnerável)\n"
-  "- 'schools_total_bad': 1=pior (pouca oferta relativa)\n"
-  "- 'share_municipal_bad': 1=pior (menor participação municipal)\n"
-  "- 'share_estadual_bad': 1=pior (menor participação estadual)\n"
-  "- 'acesso_creche_bad': 1=pior (baixo acesso)\n"
-  + ("- 'ideb_good': 1=melhor (melhor IDEB)\n" if has_ideb else "") +
-  "Calcule um 'llm_score' (0..1, maior=pior) para cada distrito com base nessas features. "
-  "Ordene do pior para o melhor ('rank': 1 = pior situação). "
-  "Defina 'tier' por quantis do llm_score (>=0.8 muito alto; >=0.6 alto; >=0.4 médio; >=0.2 baixo; senão muito baixo). "
-  "Em 'drivers' liste EXATAMENTE 3 itens com 'name' sendo APENAS um dos nomes de features PERMITIDAS, "
-  "'direction' = 'up' para piora (aumenta score) e 'down' para melhora (reduz score), e 'contribution' ≈ impacto relativo (soma ~<=1). "
-  "NÃO use nomes de distritos como drivers. Não escreva texto extra. Retorne APENAS JSON no schema."
-).format(N=N)
-
-# constrói um mapa id->norm para ancorar drivers
-norm_map = {str(d["id"]): d.get("norm", {}) for d in items}
-# normaliza chaves (caso id venha com .0)
-norm_map = {str(k).replace(".0",""): v for k,v in norm_map.items()}
-
-
-def call_llm(distritos, system_prompt, schema, temperature=0):
+
+def make_system(n, has_ideb):
+    """Prompt extremamente explícito (n = distritos nesta requisição)."""
+    return (
+      "Você é um avaliador técnico. Recebe uma lista de distritos com indicadores normalizados em 'norm'. "
+      "Há exatamente {N} distritos de entrada, e você deve devolver um array 'ranking' COM EXATAMENTE {N} ITENS "
+      "(um por distrito), NA MESMA ORDEM DOS 'id' de entrada. "
+      "Regras dos indicadores (valem para TODOS os distritos):\n"
+      "- 'marginalidade': 1=pior (mais vulnerável)\n"
+      "- 'schools_total_bad': 1=pior (pouca oferta relativa)\n"
+      "- 'share_municipal_bad': 1=pior (menor participação municipal)\n"
+      "- 'share_estadual_bad': 1=pior (menor participação estadual)\n"
+      "- 'acesso_creche_bad': 1=pior (baixo acesso)\n"
+      + ("- 'ideb_good': 1=melhor (melhor IDEB)\n" if has_ideb else "") +
+      "Calcule um 'llm_score' (0..1, maior=pior) para cada distrito com base nessas features. "
+      "Ordene do pior para o melhor ('rank': 1 = pior situação). "
+      "Defina 'tier' por quantis do llm_score (>=0.8 muito alto; >=0.6 alto; >=0.4 médio; >=0.2 baixo; senão muito baixo). "
+      "Em 'drivers' liste EXATAMENTE 3 itens com 'name' sendo APENAS um dos nomes de features PERMITIDAS, "
+      "'direction' = 'up' para piora (aumenta score) e 'down' para melhora (reduz score), e 'contribution' ≈ impacto relativo (soma ~<=1). "
+      "NÃO use nomes de distritos como drivers. Não escreva texto extra. Retorne APENAS JSON no schema."
+    ).format(N=n)
+
+def make_norm_map(items):
+    # tabela id -> norm (uma coluna por feature) para ancorar drivers; ids sem '.0'
+    ids = [str(d["id"]).replace(".0","") for d in items]
+    df = pd.DataFrame([d.get("norm", {}) for d in items], index=ids)
+    return df[~df.index.duplicated()]
+
+@lru_cache(maxsize=None)
+def contract_checker(allowed_features: tuple):
+    """Schema do ranking compilado uma vez por conjunto de features permitidas."""
+    return Checker(make_schema(0, list(allowed_features)))
+
+
+def call_llm(distritos, system_prompt, schema, temperature=0, accept=None, validate=None):
+    """
+    Chama o /api/chat e devolve o JSON do 'content'. Com CACHE ligado, reaproveita a
+    resposta de uma requisição idêntica; só grava no cache se `accept(out)` for verdadeiro.
+    Em streaming, `validate(item)` roda a cada item do ranking recebido (ver llm_client).
+    """
     url = LLM["url"]
     model = LLM["model"]
     req = {
@@ -92,131 +118,412 @@ def call_llm(distritos, system_prompt, schema, temperature=0):
             {"role":"system","content": system_prompt},
             {"role":"user","content": json.dumps({"distritos": distritos}, ensure_ascii=False)}
         ],
-        "stream": False,
+        "stream": bool(LLM.get("stream", True)),
         "format": schema,
         "options": {"temperature": temperature}
     }
-    r = requests.post(url, json=req, timeout=300)
-    r.raise_for_status()
-    return json.loads(r.json()["message"]["content"])
+    key = request_key({**req, "url": url}) if CACHE else None
+    if key:
+        hit = CACHE.get(key)
+        if hit is not None:
+            return hit
+    out = chat(url, req, timeout=LLM.get("timeout", 300), validate=validate,
+               pool_size=int(LLM.get("workers", 4)))
+    if key and (accept is None or accept(out)):
+        CACHE.put(key, out)
+    return out
 
-def sanitize_and_complete(out, distritos, allowed_feats):
-    df = pd.DataFrame(out.get("ranking", []))
-    if df.empty or len(df) < len(distritos):
-        return None
+def tier_of(p):
+    if p >= 0.8: return "muito alto"
+    if p >= 0.6: return "alto"
+    if p >= 0.4: return "médio"
+    if p >= 0.2: return "baixo"
+    return "muito baixo"
 
+def sanitize_batch(out, distritos, allowed_feats, norm_map, record=True):
+    """
+    Valida (schema compilado + ids; relatório em CONTRACT se `record`) e corrige a
+    resposta de UMA requisição, coluna a coluna. Uma linha vale se o id é de entrada
+    (1ª ocorrência) e o llm_score é numérico; o score vai p/ 0..1 e os drivers são
+    regravados com os valores reais do 'norm' (completados até 3).
+    Devolve (DataFrame id/llm_score/drivers/explanation na ordem de entrada, ids que
+    faltaram ou vieram inválidos).
+    """
     input_ids = [str(d["id"]).replace(".0","") for d in distritos]
-    df["id"] = df["id"].astype(str).str.replace(r"\.0$","", regex=True)
-    df = df.set_index("id", drop=False)
-
-    # completa ausentes
-    for i in input_ids:
-        if i not in df.index:
-            df.loc[i] = {"id": i, "rank": None, "llm_score": None, "tier": None,
-                         "drivers": [], "explanation": ""}
-
-    df = df.loc[input_ids].reset_index(drop=True)
-
-    # clamp score
-    df["llm_score"] = pd.to_numeric(df["llm_score"], errors="coerce").fillna(0.0).clip(0,1)
-
-    # >>> regravar drivers com os valores reais do 'norm'
-    def fix_drivers(row):
-        did = row["id"]
-        nv  = norm_map.get(did, {})
-        raw = row["drivers"] if isinstance(row["drivers"], list) else []
-        out = []
-        for it in raw:
-            nm = it.get("name")
-            if nm in allowed_feats:
-                val = nv.get(nm, 0.0)
-                try:
-                    val = float(val)
-                except:
-                    val = 0.0
-                out.append({"name": nm, "direction": "up" if val>=0 else "down", "contribution": float(val)})
-        # completar se vier menos de 3
-        while len(out) < 3:
-            nm = [f for f in allowed_feats if f in nv]
-            nm = (nm + allowed_feats)[len(out) % len(allowed_feats)]
-            val = float(nv.get(nm, 0.0))
-            out.append({"name": nm, "direction":"up" if val>=0 else "down", "contribution": val})
-        return out[:3]
-
-    df["drivers"] = df.apply(fix_drivers, axis=1)
-
-    # reordena por score e recalcula rank/tier localmente
+    if record:
+        CONTRACT.add(contract_checker(tuple(allowed_feats)).check(out, input_ids))
+
+    rows = out.get("ranking") if isinstance(out, dict) else None
+    rows = [r for r in (rows if isinstance(rows, list) else []) if isinstance(r, dict)]
+    ids = pd.Series([r.get("id") for r in rows], dtype=object).astype(str).str.replace(r"\.0$","", regex=True)
+    scores = pd.to_numeric(pd.Series([r.get("llm_score") for r in rows], dtype=object), errors="coerce").to_numpy(dtype="float64")
+
+    # linhas válidas: id de entrada + score finito; 1ª ocorrência de cada id, na ordem de entrada
+    pos = pd.Index(input_ids).get_indexer(ids)
+    ok = np.flatnonzero((pos >= 0) & np.isfinite(scores))
+    upos, first = np.unique(pos[ok], return_index=True)
+    sel = ok[first]
+    found = np.zeros(len(input_ids), dtype=bool)
+    found[upos] = True
+    missing = [i for i, f in zip(input_ids, found) if not f]
+
+    sel_ids = [input_ids[p] for p in upos]
+    m, L = len(sel), len(allowed_feats)
+
+    # >>> regravar drivers com os valores reais do 'norm' (formato longo: linha, slot, feature)
+    present = [f for f in allowed_feats if f in norm_map.columns]
+    M = norm_map.reindex(index=sel_ids, columns=allowed_feats).to_numpy(dtype="float64", copy=True)
+    M[:, [k for k, f in enumerate(allowed_feats) if f not in norm_map.columns]] = 0.0
+    raw = [(k, it.get("name")) for k, r in enumerate(rows[i] for i in sel)
+           for it in (r.get("drivers") if isinstance(r.get("drivers"), list) else []) if isinstance(it, dict)]
+    d_row = np.array([k for k, _ in raw], dtype=np.int64)
+    d_feat = pd.Index(allowed_feats).get_indexer(pd.Series([n for _, n in raw], dtype=object))
+    keep = d_feat >= 0
+    d_row, d_feat = d_row[keep], d_feat[keep]
+    d_slot = pd.Series(d_row).groupby(d_row).cumcount().to_numpy()
+    keep = d_slot < 3
+    d_row, d_feat, d_slot = d_row[keep], d_feat[keep], d_slot[keep]
+    # completar se vier menos de 3: slot j recebe (presentes + permitidas)[j % L]
+    cand = pd.Index(allowed_feats).get_indexer(present + allowed_feats)
+    have = np.bincount(d_row, minlength=m)
+    f_row = np.repeat(np.arange(m), 3 - have)
+    f_slot = np.concatenate([np.arange(h, 3) for h in have]) if m else np.zeros(0, dtype=np.int64)
+    d_row = np.concatenate([d_row, f_row]).astype(np.int64)
+    d_slot = np.concatenate([d_slot, f_slot]).astype(np.int64)
+    d_feat = np.concatenate([d_feat, cand[f_slot % L]]).astype(np.int64)
+    order = np.lexsort((d_slot, d_row))
+    d_row, d_feat = d_row[order], d_feat[order]
+    val = M[d_row, d_feat] if m else np.zeros(0)
+    names = np.asarray(allowed_feats, dtype=object)[d_feat].tolist()
+    dirs = np.where(val >= 0, "up", "down").tolist()
+    flat = [{"name": n, "direction": d, "contribution": v} for n, d, v in zip(names, dirs, val.tolist())]
+
+    return pd.DataFrame({
+        "id": sel_ids,
+        "llm_score": np.clip(scores[sel], 0, 1),
+        "drivers": [flat[3*k:3*k+3] for k in range(m)],
+        "explanation": pd.Series([rows[i].get("explanation") for i in sel], dtype=object).fillna("").astype(str).to_numpy(),
+    }, columns=["id","llm_score","drivers","explanation"]), missing
+
+def finalize_ranking(df):
+    """Reordena por score e recalcula rank/tier localmente (sempre sobre o conjunto GLOBAL)."""
     df = df.sort_values(["llm_score","id"], ascending=[False, True]).reset_index(drop=True)
     df["rank_sp"] = np.arange(1, len(df)+1)
 
     q = df["llm_score"].rank(pct=True)
-    def tier_of(p):
-        if p >= 0.8: return "muito alto"
-        if p >= 0.6: return "alto"
-        if p >= 0.4: return "médio"
-        if p >= 0.2: return "baixo"
-        return "muito baixo"
     df["tier"] = q.apply(tier_of)
 
     return {"ranking": df[["id","llm_score","rank_sp","tier","drivers","explanation"]].rename(columns={"rank_sp":"rank"}).to_dict(orient="records")}
 
-# 1ª tentativa com schema rígido
-try:
-    out = call_llm(items, SYSTEM, LLM_SCHEMA, temperature=LLM.get("temperature", 0))
-    result = sanitize_and_complete(out, items, allowed_features)
-except Exception as e:
-    result = None
-
-# 2ª tentativa (se necessário), com uma instrução ainda mais explícita
-if result is None:
-    time.sleep(0.5)
-    SYSTEM_RETRY = SYSTEM + "\nATENÇÃO: O array 'ranking' deve ter EXATAMENTE {N} itens, UM para CADA 'id' na MESMA ORDEM recebida.".format(N=N)
+def score_spec(norm_df):
+    """Pesos/polaridades do scoring.features (config.yaml) restritos às features presentes."""
+    return ScoreSpec.from_config(SCORING, available=set(norm_df.columns))
+
+def deterministic_score(df_in):
+    # média ponderada das features (polaridade 'good' entra como 1 - v); ver scoring.py
+    spec = score_spec(df_in)
+    return pd.Series(score(spec.matrix(df_in), spec.weights), index=df_in.index)
+
+def deterministic_ranking(norm_df):
+    """Fallback determinístico se o LLM não cumprir o contrato (drivers = top-k de peso × valor)."""
+    return rank_frame(norm_df, score_spec(norm_df), k=int(SCORING.get("top_k", 3)))
+
+# =================== ranking (1 requisição ou em lotes) ===================
+
+def rank_batch(batch, allowed_features, has_ideb, norm_map, anchors=()):
+    """
+    Pergunta o ranking do lote e guarda as linhas válidas; as tentativas seguintes
+    (até llm.retry.budget, com backoff exponencial) re-perguntam SÓ pelos ids que
+    faltaram ou vieram inválidos, com a instrução mais explícita. Com `anchors`
+    (âncoras do lote), toda re-pergunta leva as âncoras de novo: cada tentativa é
+    uma requisição com escala própria e precisa das suas âncoras para a calibração.
+    Devolve (lista com um DataFrame de linhas válidas por tentativa que trouxe alguma,
+    ids que ficaram sem resposta).
+    """
+    temperature = LLM.get("temperature", 0)
+    budget = int(RETRY.get("budget", 2))
+    backoff = float(RETRY.get("backoff_s", 0.5))
+    by_id = {str(d["id"]).replace(".0",""): d for d in batch}
+
+    def attempt(pending, retry):
+        n = len(pending)
+        schema = make_schema(n, allowed_features)
+        system = make_system(n, has_ideb)
+        if retry:
+            system += "\nATENÇÃO: O array 'ranking' deve ter EXATAMENTE {N} itens, UM para CADA 'id' na MESMA ORDEM recebida.".format(N=n)
+        check = RankingValidator([d["id"] for d in pending], allowed_features,
+                                 check_order=LLM.get("strict_order", True))
+        complete = lambda o: not sanitize_batch(o, pending, allowed_features, norm_map, record=False)[1]
+        try:
+            out = call_llm(pending, system, schema, temperature=temperature, accept=complete, validate=check)
+        except ContractViolation as e:
+            print(f"[rank] resposta abortada no item {check.seen + 1}/{n}: {e}")
+            out = e.partial      # itens válidos recebidos antes da violação
+        except Exception:
+            # sem resposta (conexão, timeout, HTTP, JSON ilegível): não conta como quebra de contrato
+            return sanitize_batch({}, pending, allowed_features, norm_map, record=False)
+        return sanitize_batch(out, pending, allowed_features, norm_map)
+
+    anchor_ids = [str(a["id"]).replace(".0","") for a in anchors]
+    frames, pending, need = [], list(batch), set(by_id)
+    for k in range(budget + 1):
+        if k:
+            time.sleep(backoff * 2 ** (k - 1))
+        df, _ = attempt(pending, retry=k > 0)
+        if len(df):
+            frames.append(df)
+        missing = [i for i in by_id if i in need and i not in set(df["id"])]
+        if missing and len(df) and k < budget:
+            print(f"[rank] tentativa {k+1}: {len(missing)}/{len(need)} id(s) sem resposta válida; re-perguntando só por eles"
+                  + (" (+ âncoras)" if anchor_ids else ""))
+        need = set(missing)
+        if not need:
+            break
+        pending = ([by_id[i] for i in anchor_ids if i in by_id]
+                   + [by_id[i] for i in missing if i not in anchor_ids])
+    return frames, sorted(need, key=list(by_id).index)
+
+def deterministic_rows(norm_df, ids):
+    """Linhas (id, llm_score, drivers, explanation) do fallback determinístico só para `ids`."""
+    key = norm_df["id"].astype(str).str.replace(r"\.0$", "", regex=True)
+    fb = deterministic_ranking(norm_df[key.isin(ids).to_numpy()])["ranking"]
+    return pd.DataFrame(fb, columns=["id","llm_score","rank","tier","drivers","explanation"])[["id","llm_score","drivers","explanation"]]
+
+def complete_with_fallback(df, norm_df):
+    """Completa com o score determinístico os distritos que o LLM não cobriu (fallback por distrito)."""
+    all_ids = norm_df["id"].astype(str).str.replace(r"\.0$", "", regex=True)
+    missing = all_ids[~all_ids.isin(df["id"])].tolist()
+    if not missing:
+        return df
+    print(f"[rank] {len(missing)} distrito(s) sem resposta válida do LLM -> score determinístico: {', '.join(missing[:10])}"
+          + (" ..." if len(missing) > 10 else ""))
+    return pd.concat([df, deterministic_rows(norm_df, missing).assign(source="deterministic")], ignore_index=True)
+
+def pick_anchors(items, score, k):
+    """k distritos espalhados pelos quantis de `score` (âncoras de calibração entre lotes)."""
+    if k <= 0 or not items:
+        return []
+    order = np.argsort(score.to_numpy(), kind="stable")
+    pos = np.unique(np.linspace(0, len(order) - 1, k).round().astype(int))
+    return [items[i] for i in order[pos]]
+
+def split_batches(items, batch_size, anchors):
+    """
+    Lotes de `batch_size` distritos (sem as âncoras), cada um encabeçado pelas mesmas
+    âncoras: resposta truncada perde o fim do array, e as âncoras continuam nela.
+    """
+    anchor_ids = {a["id"] for a in anchors}
+    rest = [it for it in items if it["id"] not in anchor_ids]
+    size = max(1, batch_size - len(anchors))
+    return [list(anchors) + rest[i:i+size] for i in range(0, len(rest), size)] or [list(anchors)]
+
+def calibrate(frames, anchor_ids, ref=None):
+    """
+    Calibração global dos scores: cada frame (uma requisição: lote ou re-pergunta) é
+    mapeado linearmente (mínimos quadrados) para que suas âncoras coincidam com `ref`
+    (id -> score); sem `ref`, com a média das âncoras em todos os frames. Um frame com
+    < 2 âncoras válidas (ou sem variação) não tem ajuste confiável: só as suas âncoras
+    ficam (com `ref`), e os demais ids dele saem daqui e caem no fallback determinístico.
+    """
+    if len(anchor_ids) < 2 or (ref is None and len(frames) < 2):
+        return frames
+    if ref is None:
+        ref = pd.concat([f[f["id"].isin(anchor_ids)] for f in frames]).groupby("id")["llm_score"].mean()
+    out = []
+    for f in frames:
+        a = f[f["id"].isin(anchor_ids)]
+        x, y = a["llm_score"].to_numpy(), ref.loc[a["id"]].to_numpy()
+        f = f.copy()
+        if len(a) >= 2 and np.ptp(x) > 1e-9:
+            slope, icpt = np.polyfit(x, y, 1)
+            f["llm_score"] = (slope * f["llm_score"] + icpt).clip(0, 1)
+        else:
+            dropped = int((~f["id"].isin(anchor_ids)).sum())
+            if dropped:
+                print(f"[rank] requisição com {len(a)} âncora(s) válida(s): {dropped} id(s) sem calibração -> fallback")
+            f = f[f["id"].isin(anchor_ids)]
+        f.loc[f["id"].isin(anchor_ids), "llm_score"] = ref.loc[f.loc[f["id"].isin(anchor_ids), "id"]].to_numpy()
+        out.append(f)
+    return out
+
+def score_batches(batches, allowed_features, has_ideb, norm_map, workers, anchors=()):
+    """Pontua os lotes em paralelo (pool limitado); devolve um DataFrame por requisição com alguma linha válida."""
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        results = list(ex.map(lambda b: rank_batch(b, allowed_features, has_ideb, norm_map, anchors), batches))
+    frames = [df for fs, _ in results for df in fs]
+    failed = sum(not fs for fs, _ in results)
+    if failed and frames:
+        print(f"[rank] {failed}/{len(batches)} lote(s) sem nenhuma resposta válida")
+    return frames
+
+def rank_batched(items, norm_df, allowed_features, has_ideb, norm_map, batch_size, workers, n_anchors):
+    """
+    Divide os distritos em lotes, pontua os lotes em paralelo e junta com calibração
+    pelas âncoras. Devolve as linhas do LLM (None se nenhuma); quem ficou sem resposta
+    entra depois pelo fallback por distrito.
+    """
+    ids = norm_df["id"].astype(str).str.replace(r"\.0$", "", regex=True)
+    det = pd.Series(deterministic_score(norm_df).to_numpy(), index=ids.to_numpy())
+    anchors = pick_anchors(items, det.reset_index(drop=True), n_anchors)
+    batches = split_batches(items, batch_size, anchors)
+    print(f"[rank] {len(items)} distritos em {len(batches)} lote(s) de até {batch_size} "
+          f"({len(anchors)} âncora(s)), {workers} worker(s)")
+
+    frames = score_batches(batches, allowed_features, has_ideb, norm_map, workers, anchors)
+    if not frames:
+        return None
+    frames = calibrate(frames, {str(a["id"]).replace(".0","") for a in anchors})
+    return pd.concat(frames).drop_duplicates("id", keep="first").reset_index(drop=True)
+
+# =================== modo incremental ===================
+
+def ranking_context(allowed_features, has_ideb) -> str:
+    """Hash do que muda o significado de um score: modelo, temperatura, features e prompt."""
+    ctx = {"model": LLM["model"], "temperature": LLM.get("temperature", 0),
+           "features": allowed_features, "prompt": make_system(0, has_ideb)}
+    return hashlib.sha256(json.dumps(ctx, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def save_inputs(norm_df, scored, context, path=OUT_RANK_INPUTS):
+    """Grava o 'norm' usado em cada distrito + origem do score (llm/deterministic) ao lado do ranking."""
+    df = norm_df.drop(columns=["name"]).copy()
+    df["id"] = df["id"].astype(str).str.replace(r"\.0$", "", regex=True)
+    src = scored.set_index("id")["source"] if scored is not None else pd.Series(dtype=object)
+    df["source"] = df["id"].map(src).fillna("deterministic")
+    df["context"] = context
+    df.to_parquet(path, engine="pyarrow", index=False)
+
+def load_previous(context, feats, rank_path=OUT_RANK, inputs_path=OUT_RANK_INPUTS):
+    """(linhas do ranking anterior, entradas anteriores) se existirem e forem do mesmo contexto; senão None."""
+    if not (os.path.exists(rank_path) and os.path.exists(inputs_path)):
+        return None
     try:
-        out = call_llm(items, SYSTEM_RETRY, LLM_SCHEMA, temperature=LLM.get("temperature", 0))
-        result = sanitize_and_complete(out, items, allowed_features)
-    except Exception:
-        result = None
-
-# Fallback determinístico se o LLM não cumprir o contrato
-if result is None:
-    df_in = pd.DataFrame([{"id": d["id"], **d["norm"]} for d in items])
-    # score simples: média das features (ideb_good entra negativo porque 1=melhor)
-    feats = base_features + (["ideb_good"] if has_ideb else [])
-    score = df_in[base_features].mean(axis=1)
-    if has_ideb:
-        score = (score*len(base_features) + (1 - df_in["ideb_good"])) / (len(base_features)+1)  # ideb_good reduz score
-    df_in["llm_score"] = score.clip(0,1)
-    df_in = df_in.sort_values(["llm_score","id"], ascending=[False, True]).reset_index(drop=True)
-    df_in["rank"] = np.arange(1, len(df_in)+1)
-
-    q = df_in["llm_score"].rank(pct=True)
-    def tier_of(p):
-        if p >= 0.8: return "muito alto"
-        if p >= 0.6: return "alto"
-        if p >= 0.4: return "médio"
-        if p >= 0.2: return "baixo"
-        return "muito baixo"
-    df_in["tier"] = q.apply(tier_of)
-
-    # drivers heurísticos: top-3 variáveis mais desfavoráveis (valores maiores após sinal adequado)
-    drv_df = df_in[feats].copy()
-    # para ideb_good (1=melhor), transformar para 'bad' temporário para escolher drivers
-    if has_ideb:
-        drv_df["ideb_good"] = 1 - drv_df["ideb_good"]
-    out_rows = []
-    for i, r in df_in.iterrows():
-        vv = drv_df.loc[i, feats].sort_values(ascending=False).head(3)
-        drivers = [{"name": k, "direction":"up", "contribution": float(v)} for k, v in vv.items()]
-        out_rows.append({
-            "id": str(r["id"]),
-            "rank": int(r["rank"]),
-            "llm_score": float(round(r["llm_score"], 6)),
-            "tier": r["tier"],
-            "drivers": drivers,
-            "explanation": ""
-        })
-    result = {"ranking": out_rows}
-
-# grava saída
-json.dump(result, open(OUT_RANK,"w",encoding="utf-8"), ensure_ascii=False, indent=2)
-print(f"[ok] ranking LLM: {OUT_RANK} (itens: {len(result['ranking'])}/{N})")
+        prev_in = pd.read_parquet(inputs_path, engine="pyarrow")
+        prev = pd.DataFrame(json.load(open(rank_path, "r", encoding="utf-8"))["ranking"])
+    except Exception as e:
+        print(f"[rank] incremental: ranking anterior ilegível ({e})")
+        return None
+    if prev_in.empty or (prev_in["context"] != context).any() or set(feature_cols(prev_in)) - {"source", "context"} != set(feats):
+        return None
+    prev["id"] = prev["id"].astype(str)
+    return prev[["id","llm_score","drivers","explanation"]], prev_in
+
+def changed_ids(norm_df, prev_in, feats) -> list:
+    """Distritos novos, com 'norm' diferente do anterior, ou que da última vez ficaram no fallback."""
+    cur = norm_df.assign(id=norm_df["id"].astype(str).str.replace(r"\.0$", "", regex=True)).set_index("id")[feats]
+    old = prev_in.set_index("id").reindex(cur.index)
+    same = np.isclose(cur.to_numpy(dtype="float64"), old[feats].to_numpy(dtype="float64"), rtol=0, atol=1e-12, equal_nan=True).all(axis=1)
+    same &= (old["source"] == "llm").to_numpy()
+    return cur.index[~same].tolist()
+
+def rank_incremental(items, norm_df, prev, prev_in, allowed_features, has_ideb, norm_map, batch_size, workers, n_anchors):
+    """
+    Reaproveita score/drivers/explicação dos distritos inalterados e manda ao LLM só os
+    alterados/novos, junto com âncoras inalteradas; os novos scores são calibrados para
+    que as âncoras batam com os scores anteriores. rank/tier são recalculados no final.
+    """
+    changed = set(changed_ids(norm_df, prev_in, allowed_features))
+    cur_ids = [str(it["id"]).replace(".0","") for it in items]
+    keep = prev[prev["id"].isin(set(cur_ids) - changed)].drop_duplicates("id").reset_index(drop=True)
+    print(f"[rank] incremental: {len(changed)} distrito(s) alterado(s)/novo(s), {len(keep)} reaproveitado(s)")
+    if not changed:
+        return keep
+
+    by_id = dict(zip(cur_ids, items))
+    send = [by_id[i] for i in cur_ids if i in changed]
+    anchors = pick_anchors([by_id[i] for i in keep["id"]], keep["llm_score"], n_anchors)
+    anchor_ids = {str(a["id"]).replace(".0","") for a in anchors}
+    batches = split_batches(send, batch_size or len(send) + len(anchors), anchors)
+    frames = score_batches(batches, allowed_features, has_ideb, norm_map, workers, anchors)
+    if not frames:
+        return keep
+    frames = calibrate(frames, anchor_ids, ref=keep.set_index("id")["llm_score"])
+    new = pd.concat(frames)
+    new = new[~new["id"].isin(anchor_ids)].drop_duplicates("id")
+    return pd.concat([keep, new], ignore_index=True)
+
+def baseline_agreement(scored, norm_df):
+    """Correlação de Spearman entre o score do LLM e o determinístico (só linhas vindas do LLM)."""
+    llm = scored[scored["source"] == "llm"].set_index("id")["llm_score"]
+    if len(llm) < 3:
+        return None
+    ids = norm_df["id"].astype(str).str.replace(r"\.0$", "", regex=True).to_numpy()
+    det = pd.Series(deterministic_score(norm_df).to_numpy(), index=ids)
+    return llm.rank().corr(det.reindex(llm.index).rank())   # Spearman = Pearson dos postos (sem scipy)
+
+def run_ranking(norm_df, incremental=False, deterministic=False):
+    """Ranking de um conjunto de features normalizadas -> (resultado, linhas pontuadas ou None, contexto)."""
+    items = norm_items(norm_df)   # formato do prompt: [{'id','name','norm':{...}}]
+    N = len(items)
+    has_ideb = "ideb_good" in norm_df.columns
+    allowed_features = base_features + (["ideb_good"] if has_ideb else [])
+    norm_map = make_norm_map(items)
+
+    batch_size = int(LLM.get("batch_size") or 0)
+    workers, n_anchors = int(LLM.get("workers", 4)), int(LLM.get("anchors", 3))
+    context = ranking_context(allowed_features, has_ideb)
+    prev = load_previous(context, allowed_features) if incremental else None
+    if incremental and prev is None:
+        print("[rank] incremental: sem ranking anterior compatível; ranking completo")
+
+    if deterministic:
+        # caminho rápido: só o score determinístico, sem LLM
+        print("[rank] modo determinístico (scoring.primary / --deterministic): LLM não consultado")
+        df = None
+    elif prev is not None:
+        df = rank_incremental(items, norm_df, *prev, allowed_features, has_ideb, norm_map,
+                              batch_size, workers, n_anchors)
+    elif batch_size and batch_size < N:
+        df = rank_batched(items, norm_df, allowed_features, has_ideb, norm_map, batch_size,
+                          workers=workers, n_anchors=n_anchors)
+    else:
+        # requisição única com todos os distritos (+ retries só dos ids faltantes)
+        frames, _ = rank_batch(items, allowed_features, has_ideb, norm_map)
+        df = pd.concat(frames, ignore_index=True).drop_duplicates("id") if frames else None
+    if df is not None and len(df):
+        scored = complete_with_fallback(df.assign(source="llm"), norm_df)
+        result = finalize_ranking(scored)
+        rho = baseline_agreement(scored, norm_df)
+        if rho is not None:
+            print(f"[rank] baseline: Spearman LLM x determinístico = {rho:.3f}")
+    else:
+        # Fallback determinístico (cidade inteira) se o LLM não devolveu nenhuma linha válida
+        scored, result = None, deterministic_ranking(norm_df)
+    return result, scored, context
+
+def main(use_cache=True, incremental=None, deterministic=None):
+    global CACHE, CONTRACT
+    CONTRACT = ContractStats()
+    if use_cache and CACHE_CFG.get("enabled", True):
+        CACHE = ResponseCache(CACHE_CFG.get("dir", "out/cache/llm"),
+                              max_mb=CACHE_CFG.get("max_mb", 200),
+                              max_age_days=CACHE_CFG.get("max_age_days", 30))
+    # Carrega as features normalizadas (Parquet colunar; JSON só se o Parquet não existir)
+    norm_df = read_norm(IN_NORM_PQ, IN_NORM)
+    N = len(norm_df)
+
+    if N == 0:
+        raise SystemExit("[erro] norm_for_llm.json não tem distritos.")
+
+    result, scored, context = run_ranking(
+        norm_df,
+        incremental=LLM.get("incremental", False) if incremental is None else incremental,
+        deterministic=SCORING.get("primary", False) if deterministic is None else deterministic)
+
+    # grava saída
+    json.dump(result, open(OUT_RANK,"w",encoding="utf-8"), ensure_ascii=False, indent=2)
+    save_inputs(norm_df, scored, context)
+    print(f"[ok] ranking LLM: {OUT_RANK} (itens: {len(result['ranking'])}/{N})")
+    if CACHE:
+        print(f"[cache] respostas LLM: {CACHE.summary()}")
+    if CONTRACT.responses:
+        CONTRACT.dump(OUT_CONTRACT)
+        print(f"[contrato] {CONTRACT.summary()} -> {OUT_CONTRACT}")
+
+if __name__ == "__main__":
+    # --no-cache: ignora (e não grava) respostas em cache
+    # --incremental / --full: sobrepõem llm.incremental
+    # --deterministic: só o score determinístico (sobrepõe scoring.primary)
+    args = sys.argv[1:]
+    main(use_cache="--no-cache" not in args,
+         incremental=True if "--incremental" in args else False if "--full" in args else None,
+         deterministic=True if "--deterministic" in args else None)
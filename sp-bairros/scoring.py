@@ -0,0 +1,121 @@
+# scoring.py
+"""
+Score determinístico vetorizado (fallback do LLM, caminho rápido e baseline).
+
+Cada feature normalizada (0..1) tem peso e polaridade no config.yaml:
+  bad  -> 1 = pior, entra como v
+  good -> 1 = melhor, entra como 1 - v
+O score é o produto matriz-vetor X @ w / Σw (0..1, maior = pior); NaN fica fora
+da média daquela linha. Pesos precisam ser ≥ 0 com soma > 0. Linha sem nenhuma
+feature válida não tem score: no ranking vai para o fim com llm_score 0 e sem
+drivers. Os drivers são as top-k contribuições w × v por linha (NaN nunca entra),
+escolhidas com np.partition (sem ordenar a linha inteira), empates pela ordem
+das features no config.
+"""
+import numpy as np
+import pandas as pd
+
+# padrão = pesos iguais, ideb_good com sinal invertido (comportamento original)
+DEFAULT_FEATURES = {
+    "marginalidade":       {"weight": 1.0, "polarity": "bad"},
+    "schools_total_bad":   {"weight": 1.0, "polarity": "bad"},
+    "share_municipal_bad": {"weight": 1.0, "polarity": "bad"},
+    "share_estadual_bad":  {"weight": 1.0, "polarity": "bad"},
+    "acesso_creche_bad":   {"weight": 1.0, "polarity": "bad"},
+    "ideb_good":           {"weight": 1.0, "polarity": "good"},
+}
+TIER_CUTS = [(0.8, "muito alto"), (0.6, "alto"), (0.4, "médio"), (0.2, "baixo")]
+
+class ScoreSpec:
+    """Features presentes (na ordem do config), pesos e máscara de polaridade 'good'."""
+
+    def __init__(self, features: dict, available=None):
+        names = [f for f in features if available is None or f in available]
+        if not names:
+            raise ValueError("[score] nenhuma feature do scoring.features existe no norm")
+        self.features = names
+        self.weights = np.array([float(features[f].get("weight", 1.0)) for f in names])
+        neg = [f for f, w in zip(names, self.weights) if not np.isfinite(w) or w < 0]
+        if neg:
+            raise ValueError(f"[score] peso negativo/inválido em {neg} (use pesos ≥ 0)")
+        if not self.weights.sum() > 0:
+            raise ValueError(f"[score] soma dos pesos é 0 nas features presentes {names}")
+        pol = [str(features[f].get("polarity", "bad")).lower() for f in names]
+        bad = sorted({p for p in pol if p not in ("bad", "good")})
+        if bad:
+            raise ValueError(f"[score] polaridade inválida {bad} (use 'bad' ou 'good')")
+        self.good = np.array([p == "good" for p in pol])
+
+    @classmethod
+    def from_config(cls, scoring_cfg, available=None):
+        feats = (scoring_cfg or {}).get("features") or DEFAULT_FEATURES
+        return cls(feats, available)
+
+    def matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """Matriz n×f já no sentido 'maior = pior'."""
+        X = df[self.features].to_numpy(dtype="float64")
+        return np.where(self.good, 1.0 - X, X)
+
+def score(X: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """Média ponderada por linha (X @ w / Σw), ignorando NaN; 0..1. NaN só se a linha não tiver feature válida."""
+    nan = np.isnan(X)
+    if not nan.any():
+        s = X @ w / w.sum()
+    else:
+        den = (~nan) @ w
+        s = np.divide(np.where(nan, 0.0, X) @ w, den, out=np.full(len(X), np.nan), where=den > 0)
+    return np.clip(s, 0, 1)
+
+def top_k(C: np.ndarray, k: int):
+    """
+    Índices (n×k) das k maiores contribuições por linha, em ordem decrescente;
+    empate -> menor índice de coluna. Seleção via np.partition (O(f) por linha).
+    """
+    n, f = C.shape
+    k = min(k, f)
+    C = np.where(np.isnan(C), -np.inf, C)
+    if k < f:
+        kth = -np.partition(-C, k - 1, axis=1)[:, k - 1:k]   # k-ésimo maior valor por linha
+        gt = C > kth
+        tie = C == kth
+        need = k - gt.sum(axis=1, keepdims=True)
+        sel = gt | (tie & (np.cumsum(tie, axis=1) <= need))
+        idx = np.nonzero(sel)[1].reshape(n, k)                   # colunas em ordem crescente
+    else:
+        idx = np.broadcast_to(np.arange(f), (n, f))
+    vals = np.take_along_axis(C, idx, axis=1)
+    order = np.argsort(-vals, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+def tiers(score: pd.Series) -> np.ndarray:
+    """Tier pelo percentil do score no conjunto (mesmas faixas do prompt)."""
+    q = score.rank(pct=True).to_numpy()
+    return np.select([q >= c for c, _ in TIER_CUTS], [t for _, t in TIER_CUTS], default="muito baixo")
+
+def rank_frame(norm_df: pd.DataFrame, spec: ScoreSpec, k=3) -> dict:
+    """Ranking determinístico completo no formato do llm_ranking.json."""
+    X = spec.matrix(norm_df)
+    s = score(X, spec.weights)
+    nodata = np.isnan(s)
+    if nodata.any():
+        print(f"[score] {int(nodata.sum())} distrito(s) sem nenhuma feature válida: llm_score 0, fim do ranking")
+    df = pd.DataFrame({"id": norm_df["id"].astype(str).to_numpy(), "llm_score": np.where(nodata, 0.0, s),
+                       "_nodata": nodata, "_row": np.arange(len(s))})
+    df = df.sort_values(["_nodata", "llm_score", "id"], ascending=[True, False, True]).reset_index(drop=True)
+    df["tier"] = tiers(df["llm_score"])
+
+    C = X[df["_row"].to_numpy()] * spec.weights
+    idx = top_k(C, k)
+    names = np.asarray(spec.features, dtype=object)[idx].tolist()
+    contrib = np.take_along_axis(C, idx, axis=1).tolist()   # NaN = feature ausente: fica fora dos drivers
+
+    rows = [{
+        "id": i,
+        "rank": r,
+        "llm_score": float(round(v, 6)),
+        "tier": t,
+        "drivers": [{"name": nm, "direction": "up", "contribution": float(c)} for nm, c in zip(nn, cc) if c == c],
+        "explanation": "",
+    } for i, r, v, t, nn, cc in zip(df["id"].tolist(), range(1, len(df) + 1), df["llm_score"].tolist(),
+                                     df["tier"].tolist(), names, contrib)]
+    return {"ranking": rows}
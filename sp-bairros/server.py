@@ -1,23 +1,69 @@
-import os, json, hashlib, tempfile, time
+import os, re, gzip, json, uuid, socket, hashlib, sqlite3, tempfile, threading, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import NamedTuple, Optional
+import yaml
 from fastapi import FastAPI, Response, Request, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse
 import brotli
+try:
+    import zstandard
+except ImportError:          # sem zstandard: variantes br/gzip/identity
+    zstandard = None
 
 # CONFIG
-FINAL_FC = Path("out/distritos_front.geojson")      # arquivo que seu ETL produz
+CONFIG = os.environ.get("SP_CONFIG", "config.yaml")      # pipeline.py --config repassa o caminho
+_OUT = (yaml.safe_load(open(CONFIG, "r", encoding="utf-8")) or {}).get("outputs", {}) if os.path.exists(CONFIG) else {}
+FINAL_FC = Path(_OUT.get("final_geojson", "out/distritos_front.geojson"))   # arquivo que seu ETL produz
+GEOM_FC  = Path(_OUT.get("geom_geojson", "out/distritos_geom.geojson"))     # build: só geometria + id (muda raramente)
+ATTRS_JSON = Path(_OUT.get("attrs_json", "out/distritos_attrs.json"))      # build: {id: properties} (muda a cada ranking)
 CACHE_DIR = Path("out/cdn_cache")
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
-CACHE_FILE = CACHE_DIR / "distritos_front.geojson"   # minificado (sem encoding)
-CACHE_BR   = CACHE_DIR / "distritos_front.geojson.br"
-ETAG_FILE  = CACHE_DIR / "distritos_front.etag"
+CACHE_FILE = CACHE_DIR / FINAL_FC.name                 # minificado (sem encoding)
+CACHE_BR   = CACHE_DIR / (FINAL_FC.name + ".br")
+ETAG_FILE  = CACHE_DIR / f"{FINAL_FC.stem}.etag"
 LOCK_FILE  = CACHE_DIR / ".build.lock"
+TAKEOVER_FILE = CACHE_DIR / ".build.lock.takeover"        # serializa a remoção de lock velho entre processos
+LOD_RE     = re.compile(r"^[a-z0-9_-]+$")                # mesmo formato de lod.NAME_RE
+TILES_MBT  = Path(_OUT.get("tiles_mbtiles", "out/distritos.mbtiles"))   # build_tiles.py (MVT em gzip)
+
+ENC_SUFFIX = {"br": ".br", "gzip": ".gz", "zstd": ".zst"}   # variantes ao lado do CACHE_FILE (identity)
+ENC_PREF   = ("br", "zstd", "gzip", "identity")            # desempate no mesmo q: menor corpo primeiro
 
 CACHE_CONTROL = "public, max-age=31536000, immutable"
 CONTENT_TYPE  = "application/geo+json; charset=utf-8"
+TILE_CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"   # URL do tile não muda entre builds
+GEOM_CACHE_CONTROL = "public, max-age=604800, stale-while-revalidate=2592000"  # geometria quase nunca muda
+ATTRS_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=600"         # ranking novo aparece em ~1 min
+JSON_TYPE     = "application/json; charset=utf-8"
+TILE_TYPE     = "application/vnd.mapbox-vector-tile"
+WATCH_INTERVAL = float(os.environ.get("SP_WATCH_INTERVAL", "2"))   # s entre stats do watcher (0 = desligado)
+TILES_KEY     = "tiles"
+# recurso servido a partir de um arquivo do build -> (fonte, Cache-Control, Content-Type); chave "<recurso>:<lod>"
+RESOURCES = {
+    "geojson":    (FINAL_FC, CACHE_CONTROL, CONTENT_TYPE),
+    "geometry":   (GEOM_FC, GEOM_CACHE_CONTROL, CONTENT_TYPE),
+    "attributes": (ATTRS_JSON, ATTRS_CACHE_CONTROL, JSON_TYPE),
+}
+COLD_WAIT_S   = float(os.environ.get("SP_COLD_WAIT_S", "10"))     # 1ª carga sem versão anterior: espera máx.
+LOCK_WAIT_S   = 120.0                                              # job espera o lock de outro processo
+LOCK_STALE_S  = float(os.environ.get("SP_LOCK_STALE_S", "900"))   # lock mais velho que isso = build que morreu
+MAX_JOBS      = 100                                                # jobs guardados para /geojson/rebuild/{id}
+
+@asynccontextmanager
+async def _lifespan(app):
+    # versões já em memória antes do 1º request; o watcher troca quando o build regrava os fontes
+    for key, src in [(f"{r}:full", v[0]) for r, v in RESOURCES.items()] + [(TILES_KEY, TILES_MBT)]:
+        if src.exists():
+            _submit("load", [key])
+    if WATCH_INTERVAL > 0:
+        threading.Thread(target=_watch, name="artifact-watcher", daemon=True).start()
+    yield
 
-app = FastAPI()
+app = FastAPI(lifespan=_lifespan)
 
 def _sha256_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
@@ -32,6 +78,9 @@ def _atomic_write(path: Path, data: bytes, mode="wb"):
     os.replace(tmp_name, path)  # atomic move
 
 def _minify_geojson_bytes(raw: bytes) -> bytes:
+    # build_featurecollection.py já grava minificado (uma linha só): nada a fazer
+    if b"\n" not in raw:
+        return raw
     # parse + dump minificado para validar JSON e remover espaços
     obj = json.loads(raw.decode("utf-8"))
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -39,142 +88,557 @@ def _minify_geojson_bytes(raw: bytes) -> bytes:
 def _bro_compress(b: bytes) -> bytes:
     return brotli.compress(b, quality=11, mode=brotli.MODE_TEXT)
 
-def _locked() -> bool:
-    return LOCK_FILE.exists()
+def _compress(enc: str, b: bytes) -> bytes:
+    if enc == "br":
+        return _bro_compress(b)
+    if enc == "gzip":
+        return gzip.compress(b, compresslevel=9, mtime=0)
+    return zstandard.ZstdCompressor(level=19).compress(b)
+
+def _encodings() -> list:
+    """Variantes comprimidas que este processo sabe gerar."""
+    return [e for e in ENC_SUFFIX if e != "zstd" or zstandard is not None]
+
+def _variant_path(cache_file: Path, enc: str) -> Path:
+    return cache_file if enc == "identity" else cache_file.with_name(cache_file.name + ENC_SUFFIX[enc])
 
-def _acquire_lock() -> bool:
+def _precompressed(src: Path, suffix: str) -> Optional[bytes]:
+    """Versão pré-comprimida gravada pelo build ao lado do fonte (ex.: .br), se não estiver velha."""
+    p = src.with_name(src.name + suffix)
+    try:
+        if p.stat().st_mtime >= src.stat().st_mtime:
+            return p.read_bytes()
+    except FileNotFoundError:
+        pass
+    return None
+
+def _lod_paths(lod: Optional[str] = None, resource: str = "geojson") -> tuple:
+    """
+    (fonte, cache minificado, cache .br, etag) de um recurso num nível de detalhe.
+    lod None/'full' = geometria completa; senão o arquivo do build <fonte>.<lod>.geojson.
+    """
+    base = RESOURCES[resource][0]
+    src = base if not lod or lod == "full" else base.with_name(f"{base.stem}.{lod}{base.suffix}")
+    return src, CACHE_DIR / src.name, CACHE_DIR / (src.name + ".br"), CACHE_DIR / f"{src.stem}.etag"
+
+def _lods(resource: str = "geojson") -> list:
+    """LODs disponíveis (arquivos gerados pelo build ao lado da fonte do recurso)."""
+    base = RESOURCES[resource][0]
+    names = [p.name[len(base.stem) + 1:-len(base.suffix)] for p in base.parent.glob(f"{base.stem}.*{base.suffix}")]
+    return sorted(n for n in names if LOD_RE.match(n))
+
+def _all_keys() -> list:
+    """Chaves de todos os recursos cujo arquivo existe (completos + LODs)."""
+    return [f"{r}:{lod}" for r, (src, _, _) in RESOURCES.items() if src.exists() for lod in ["full"] + _lods(r)]
+
+def _acquire_lock() -> Optional[dict]:
+    """Cria o lock de forma exclusiva (O_CREAT|O_EXCL); devolve o conteúdo gravado (dono) ou None."""
+    owner = {"pid": os.getpid(), "host": socket.gethostname(), "t": time.time(), "token": uuid.uuid4().hex}
     try:
-        # try create exclusively
         fd = os.open(str(LOCK_FILE), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-        os.write(fd, str(time.time()).encode("utf-8"))
-        os.close(fd)
-        return True
     except FileExistsError:
-        return False
+        return None
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(json.dumps(owner))
+    return owner
 
-def _release_lock():
+def _release_lock(owner: dict):
+    """Remove o lock só se ainda for nosso (pid/host/token): um lock tomado como velho por outro fica."""
+    info = _lock_info()
+    if not info or any(info.get(k) != owner[k] for k in ("pid", "host", "token")):
+        print(f"[server] lock em {LOCK_FILE} não é mais deste processo ({info}); mantendo")
+        return
     try:
         LOCK_FILE.unlink(missing_ok=True)
-    except Exception:
+    except OSError:
         pass
 
-def _read_etag() -> Optional[str]:
+def _take_over_stale() -> bool:
+    """
+    Tira do caminho um lock velho. Um processo por vez (TAKEOVER_FILE via O_EXCL), e o
+    lock é julgado de novo já com esse mutex: quem chega depois vê o lock novo de quem
+    acabou de tomar, não o velho. O lock é movido por rename atômico para um nome único
+    e conferido; se não for o julgado, volta (link, sem sobrescrever). Quem fica com o
+    lock é decidido depois pelo O_EXCL de _acquire_lock. False = outro processo está tomando.
+    """
+    try:
+        os.close(os.open(str(TAKEOVER_FILE), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:                                # quem estava tomando morreu no meio (a tomada leva ms)
+            if time.time() - TAKEOVER_FILE.stat().st_mtime > 30:
+                TAKEOVER_FILE.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        return False
+    try:
+        info = _lock_info()
+        if not _lock_stale(info):
+            return True
+        print(f"[server] lock velho em {LOCK_FILE} ({info}); removendo")
+        grave = LOCK_FILE.with_name(f"{LOCK_FILE.name}.stale.{os.getpid()}.{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(LOCK_FILE, grave)
+        except FileNotFoundError:           # o dono acabou de liberar
+            return True
+        try:
+            if _lock_info(grave) != info:
+                try:
+                    os.link(grave, LOCK_FILE)
+                except FileExistsError:
+                    pass
+        finally:
+            grave.unlink(missing_ok=True)
+        return True
+    finally:
+        TAKEOVER_FILE.unlink(missing_ok=True)
+
+def _lock_info(path: Path = LOCK_FILE) -> Optional[dict]:
     try:
-        return ETAG_FILE.read_text(encoding="utf-8").strip()
+        raw = path.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    try:
+        info = json.loads(raw)
+    except ValueError:
+        info = None
+    if not isinstance(info, dict):          # formato antigo: só o timestamp
+        try:
+            info = {"t": float(raw)}
+        except ValueError:
+            info = {}
+    return info
+
+def _lock_stale(info: Optional[dict]) -> bool:
+    """Lock deixado por um build que morreu: processo inexistente (mesmo host) ou mais velho que LOCK_STALE_S."""
+    if info is None:
+        return False
+    try:
+        t = float(info.get("t") or LOCK_FILE.stat().st_mtime)
+    except FileNotFoundError:
+        return False
+    if time.time() - t > LOCK_STALE_S:
+        return True
+    if info.get("host") == socket.gethostname() and info.get("pid"):
+        try:
+            os.kill(int(info["pid"]), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return False
+
+@contextmanager
+def _build_lock(wait: float = LOCK_WAIT_S):
+    """Lock de build entre processos; recupera lock velho. Só roda fora do caminho dos requests."""
+    deadline = time.monotonic() + wait
+    owner = _acquire_lock()
+    while owner is None:
+        info = _lock_info()
+        if _lock_stale(info):
+            if not _take_over_stale():
+                time.sleep(0.05)
+        elif time.monotonic() > deadline:
+            raise TimeoutError(f"lock de build ocupado há mais de {wait:.0f}s: {LOCK_FILE} ({info})")
+        else:
+            time.sleep(0.5)
+        owner = _acquire_lock()
+    try:
+        yield
+    finally:
+        _release_lock(owner)
+
+def _read_etag(etag_file: Path = ETAG_FILE) -> Optional[str]:
+    try:
+        return etag_file.read_text(encoding="utf-8").strip()
     except Exception:
         return None
 
-def _write_etag(etag: str):
-    _atomic_write(ETAG_FILE, etag.encode("utf-8"))
+def _write_etag(etag: str, etag_file: Path = ETAG_FILE):
+    _atomic_write(etag_file, etag.encode("utf-8"))
 
-def _ensure_cache(build_if_missing: bool = True) -> str:
+def _ensure_cache(build_if_missing: bool = True, lod: Optional[str] = None, force: bool = False,
+                  resource: str = "geojson") -> str:
     """
-    Garante CACHE_FILE/CACHE_BR/ETAG existam e estejam sincronizados com FINAL_FC.
-    Retorna etag atual.
+    Garante que o cache do LOD (minificado = identity, .br, .gz, .zst e etag do .br) exista e
+    esteja sincronizado com o fonte (force=True reconstrói mesmo se estiver em dia). Retorna etag atual.
     """
-    if not FINAL_FC.exists():
-        raise FileNotFoundError(f"GeoJSON fonte não encontrado: {FINAL_FC}")
+    src, cache_file, cache_br, etag_file = _lod_paths(lod, resource)
+    if not src.exists():
+        raise FileNotFoundError(f"fonte não encontrado: {src}")
+    variants = [_variant_path(cache_file, e) for e in _encodings()]
 
     # se cache existe e é mais novo que o fonte, usa cache
-    if CACHE_BR.exists() and CACHE_FILE.exists():
-        if CACHE_BR.stat().st_mtime >= FINAL_FC.stat().st_mtime:
-            etag = _read_etag()
+    if not force and cache_file.exists() and all(p.exists() for p in variants):
+        if cache_br.stat().st_mtime >= src.stat().st_mtime:
+            etag = _read_etag(etag_file)
             if etag:
                 return etag
 
-    if not build_if_missing and not CACHE_BR.exists():
+    if not build_if_missing and not cache_br.exists():
         raise FileNotFoundError("Cache inexistente.")
 
-    # build (pode demorar um pouco na primeira vez)
-    raw = FINAL_FC.read_bytes()
+    # build (pode demorar um pouco na primeira vez): uma leitura do fonte, todas as variantes
+    st = src.stat()
+    raw = src.read_bytes()
     mini = _minify_geojson_bytes(raw)
-    br = _bro_compress(mini)
-    etag = _sha256_bytes(br)
-
-    _atomic_write(CACHE_FILE, mini)
-    _atomic_write(CACHE_BR, br)
-    _write_etag(etag)
+    _atomic_write(cache_file, mini)
+    for enc, p in zip(_encodings(), variants):
+        # variante gravada pelo build (fc_writer) quando o fonte já veio minificado; senão comprime aqui
+        body = (_precompressed(src, ENC_SUFFIX[enc]) if mini is raw else None) or _compress(enc, mini)
+        _atomic_write(p, body)
+        if enc == "br":
+            etag = _sha256_bytes(body)
+    _write_etag(etag, etag_file)
+    # cache leva o mtime do fonte que foi lido: se o fonte for regravado durante o build, fica velho
+    for p in [cache_file] + variants:
+        os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns))
     return etag
 
-@app.get("/geojson")
-def get_geojson(request: Request):
+# ---------- versões em memória ----------
+class Artifact(NamedTuple):
+    """Um corpo servido (uma codificação), imutável: o watcher troca a versão inteira, nunca altera uma publicada."""
+    etag: str
+    body: bytes
+    headers: dict
+
+class Variants(NamedTuple):
+    """Mesmo recurso nas codificações disponíveis: {encoding: Artifact}, cada uma com seu ETag."""
+    sig: Optional[tuple]        # assinatura do fonte (mtime_ns, tamanho, inode) quando carregado
+    encodings: tuple            # chaves de by_enc, para a negociação
+    by_enc: dict
+
+class TileSet(NamedTuple):
+    """Pirâmide inteira do MBTiles em memória: {(z, x, y): Variants} + metadata."""
+    sig: Optional[tuple]
+    tiles: dict
+    meta: dict
+
+_versions: dict = {}              # "<recurso>:<lod>" / TILES_KEY -> Variants / TileSet
+_publish_lock = threading.Lock()
+_served = Counter()               # (rota, encoding) -> respostas 200 (GET /stats)
+
+def _sig(p: Path) -> Optional[tuple]:
+    try:
+        st = p.stat()
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        return None
+
+def _source(key: str) -> Path:
+    if key == TILES_KEY:
+        return TILES_MBT
+    resource, lod = key.split(":", 1)
+    return _lod_paths(lod, resource)[0]
+
+def _artifact(body: bytes, enc: str, cache_control: str) -> Artifact:
+    # ETag por variante: o mesmo recurso em br e em gzip são representações diferentes
+    etag = _sha256_bytes(body)
+    headers = {"Cache-Control": cache_control, "ETag": f"\"{etag}\"", "Vary": "Accept-Encoding"}
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    return Artifact(etag, body, headers)
+
+def _variants(sig, bodies: dict, cache_control: str) -> Variants:
+    by_enc = {e: _artifact(b, e, cache_control) for e, b in bodies.items()}
+    return Variants(sig, tuple(by_enc), by_enc)
+
+def _load_resource(resource: str, lod: str, force: bool = False) -> Variants:
+    src, cache_file, _, _ = _lod_paths(lod, resource)
+    sig = _sig(src)                 # antes do build: se o fonte mudar no meio, o watcher recarrega
+    _ensure_cache(build_if_missing=True, lod=lod, force=force, resource=resource)
+    bodies = {e: _variant_path(cache_file, e).read_bytes() for e in _encodings() + ["identity"]}
+    return _variants(sig, bodies, RESOURCES[resource][1])
+
+def _load_tiles() -> TileSet:
+    sig = _sig(TILES_MBT)
+    con = sqlite3.connect(f"file:{TILES_MBT}?mode=ro", uri=True)
+    try:
+        meta = dict(con.execute("SELECT name, value FROM metadata").fetchall())
+        rows = con.execute("SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles").fetchall()
+    finally:
+        con.close()
+    tiles = {}
+    for z, x, row, data in rows:
+        # linhas do MBTiles são TMS (y de baixo para cima); identity descomprimido uma vez, aqui
+        data = bytes(data)
+        tiles[(z, x, (2 ** z - 1) - row)] = _variants(sig, {"gzip": data, "identity": gzip.decompress(data)},
+                                                      TILE_CACHE_CONTROL)
+    return TileSet(sig, tiles, meta)
+
+def _load(key: str, force: bool = False):
+    if key == TILES_KEY:
+        return _load_tiles()
+    resource, lod = key.split(":", 1)
+    return _load_resource(resource, lod, force)
+
+def _publish(key: str, version):
+    """Troca atômica: publica um dict novo; leitores seguram a referência antiga até terminar."""
+    global _versions
+    with _publish_lock:
+        _versions = {**_versions, key: version}
+
+# ---------- jobs em background (stale-while-revalidate) ----------
+class Job:
+    """Carga/rebuild de versões na fila do executor; estado em GET /geojson/rebuild/{id}."""
+
+    def __init__(self, kind: str, keys, force=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind, self.keys, self.force = kind, list(keys), force
+        self.status = "queued"
+        self.created_at, self.started_at, self.finished_at = time.time(), None, None
+        self.result, self.error = None, None
+        self.future = None
+
+    def to_dict(self) -> dict:
+        ts = lambda t: time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)) if t else None
+        return {"id": self.id, "kind": self.kind, "keys": self.keys, "status": self.status,
+                "created_at": ts(self.created_at), "started_at": ts(self.started_at),
+                "finished_at": ts(self.finished_at), "result": self.result, "error": self.error}
+
+# um worker: builds (brotli q11) não competem entre si; os requests seguem servindo a versão anterior
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rebuild")
+_jobs: dict = {}                   # id -> Job (últimos MAX_JOBS)
+_inflight: dict = {}               # (kind, keys, force) -> Job ainda não terminado
+_jobs_lock = threading.Lock()
+
+def _busy(key: str) -> bool:
+    return any(key in j.keys for j in list(_inflight.values()))
+
+def _submit(kind: str, keys, force: bool = False) -> Job:
+    """Enfileira o job; um igual que ainda não começou é reaproveitado (vai ler o fonte mais novo)."""
+    sig = (kind, tuple(keys), force)
+    with _jobs_lock:
+        job = _inflight.get(sig)
+        if job is not None and job.status == "queued":
+            return job
+        job = Job(kind, keys, force)
+        _jobs[job.id] = job
+        _inflight[sig] = job
+        for old in list(_jobs)[:-MAX_JOBS]:
+            del _jobs[old]
+        job.future = _executor.submit(_run_job, job, sig)
+    return job
+
+def _run_job(job: Job, sig: tuple):
+    job.status, job.started_at = "running", time.time()
+    try:
+        needs_lock = any(k != TILES_KEY for k in job.keys)        # tiles só leem; os outros escrevem o cache CDN
+        with _build_lock() if needs_lock else nullcontext():
+            new = {k: _load(k, job.force) for k in job.keys}
+        for k, v in new.items():
+            _publish(k, v)
+        job.result = {k: ({e: a.etag for e, a in v.by_enc.items()} if isinstance(v, Variants) else f"{len(v.tiles)} tiles")
+                      for k, v in new.items()}
+        job.status = "done"
+        print(f"[server] job {job.id} ({job.kind}): {', '.join(job.keys)} em memória "
+              f"({time.time() - job.started_at:.1f}s)")
+    except Exception as e:
+        job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        print(f"[server] job {job.id} ({job.kind}) falhou: {job.error}; mantendo a versão anterior")
+        raise
+    finally:
+        job.finished_at = time.time()
+        with _jobs_lock:
+            if _inflight.get(sig) is job:
+                del _inflight[sig]
+
+def _get_version(key: str):
     """
-    Entrega o GeoJSON minificado + Brotli do cache.
-    Se não existir, constrói na primeira chamada e já entrega.
+    Versão publicada. Sem nenhuma (1ª carga) não há o que servir velho: espera o job
+    até COLD_WAIT_S e, se não der, 503 + Retry-After.
     """
-    # If-None-Match para 304
+    v = _versions.get(key)
+    if v is not None:
+        return v
+    job = _submit("load", [key])
+    try:
+        job.future.result(timeout=COLD_WAIT_S)
+    except FutureTimeout:
+        raise HTTPException(status_code=503, detail=f"{key}: carregando", headers={"Retry-After": "5"})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _versions[key]
+
+def _watch():
+    """Poll de stat nos fontes das versões carregadas; fonte mudou -> job de recarga (a versão atual segue no ar)."""
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        for key, v in list(_versions.items()):
+            sig = _sig(_source(key))
+            if sig is None or sig == v.sig or _busy(key):
+                continue            # fonte sumiu, igual ou já recarregando: segue servindo a versão atual
+            _submit("reload", [key])
+
+@lru_cache(maxsize=256)
+def _negotiate(accept: Optional[str], available: tuple) -> Optional[str]:
+    """
+    Codificação a servir dado o Accept-Encoding (RFC 9110, com q-values). Sem o header:
+    identity. Maior q vence; empate -> ENC_PREF. None = nada aceitável (406).
+    """
+    if accept is None:
+        return "identity" if "identity" in available else None
+    q, star = {}, None
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        w = 1.0
+        for prm in params.split(";"):
+            k, _, v = prm.strip().partition("=")
+            if k.strip().lower() == "q":
+                try:
+                    w = float(v)
+                except ValueError:
+                    w = 0.0
+        if name == "*":
+            star = w
+        else:
+            q[name] = max(w, q.get(name, 0.0))
+    def weight(enc):
+        if enc in q:
+            return q[enc]
+        if star is not None:
+            return star
+        return 1e-3 if enc == "identity" else 0.0    # identity: aceitável salvo recusa explícita, mas por último
+    ranked = [(weight(e), -ENC_PREF.index(e), e) for e in available if e in ENC_PREF]
+    best = max(ranked, default=(0.0, 0, None))
+    return best[2] if best[0] > 0 else None
+
+def _pick(request: Request, v: Variants, route: str) -> Artifact:
+    enc = _negotiate(request.headers.get("accept-encoding"), v.encodings)
+    if enc is None:
+        raise HTTPException(status_code=406, detail=f"nenhuma codificação aceitável (disponíveis: {', '.join(v.encodings)})")
+    _served[(route, enc)] += 1
+    return v.by_enc[enc]
+
+def _not_modified(request: Request, a: Artifact) -> bool:
     client_etag = request.headers.get("if-none-match")
+    if not client_etag:
+        return False
+    return client_etag.strip() == "*" or any(t.strip().removeprefix("W/").strip('"') == a.etag
+                                             for t in client_etag.split(","))
 
-    # tenta garantir cache; se já estiver construindo por outra thread/processo, espera
-    if not CACHE_BR.exists():
-        # tenta lock (build inline)
-        got_lock = _acquire_lock()
-        try:
-            if got_lock:
-                etag = _ensure_cache(build_if_missing=True)
-            else:
-                # outro build em progresso; espera um pouco ou tenta servir parcial
-                # espera até 25s (5x5s) antes de desistir
-                for _ in range(5):
-                    if CACHE_BR.exists():
-                        break
-                    time.sleep(5)
-                etag = _read_etag() or _ensure_cache(build_if_missing=True)
-        finally:
-            if got_lock:
-                _release_lock()
-    else:
-        # cache existe: se o fonte foi atualizado, rebuilda em linha
-        if FINAL_FC.exists() and FINAL_FC.stat().st_mtime > CACHE_BR.stat().st_mtime:
-            got_lock = _acquire_lock()
-            try:
-                if got_lock:
-                    _ensure_cache(build_if_missing=True)
-            finally:
-                if got_lock:
-                    _release_lock()
-        etag = _read_etag() or _ensure_cache(build_if_missing=True)
-
-    # 304
-    if client_etag and etag and client_etag.strip('"') == etag:
-        return Response(status_code=304)
-
-    # serve .br
-    data = CACHE_BR.read_bytes()
-    return Response(
-        content=data,
-        media_type=CONTENT_TYPE,
-        headers={
-            "Content-Encoding": "br",
-            "Cache-Control": CACHE_CONTROL,
-            "ETag": f"\"{etag}\""
-        }
-    )
+def _not_modified_response(a: Artifact) -> Response:
+    return Response(status_code=304, headers={k: a.headers[k] for k in ("ETag", "Vary", "Cache-Control")})
+
+@app.get("/geojson")
+def get_geojson(request: Request, lod: Optional[str] = None):
+    """
+    Entrega o GeoJSON minificado da versão em memória, na codificação negociada pelo
+    Accept-Encoding (br, zstd, gzip ou identity; ETag por variante + Vary).
+    Se o cache não existir, constrói na primeira chamada e já entrega.
+    ?lod=<nome> escolhe o nível de detalhe (build.lods; ausente/'full' = completo).
+    """
+    return _serve(request, "geojson", lod)
+
+@app.get("/geometry")
+def get_geometry(request: Request, lod: Optional[str] = None):
+    """
+    Só a geometria: FeatureCollection com "id" em cada Feature e nenhum atributo além dele.
+    Cache longo (GEOM_CACHE_CONTROL) e ETag próprio, que não muda quando o ranking muda.
+    ?lod=<nome> como em /geojson.
+    """
+    return _serve(request, "geometry", lod)
+
+@app.get("/attributes")
+def get_attributes(request: Request):
+    """
+    Tabela de atributos por id ({id: {norm, llm_score, rank_sp, tier, drivers, explanation, ...}}):
+    poucos KB, cache curto (ATTRS_CACHE_CONTROL) e ETag próprio. Junta com /geometry pelo id.
+    """
+    return _serve(request, "attributes", None)
+
+def _serve(request: Request, resource: str, lod: Optional[str]) -> Response:
+    lod = (lod or "full").strip().lower()
+    key = f"{resource}:{lod}"
+    v = _versions.get(key)
+    if v is None:
+        if lod != "full" and (not LOD_RE.match(lod) or not _lod_paths(lod, resource)[0].exists()):
+            raise HTTPException(status_code=404,
+                                detail=f"lod desconhecido: {lod!r} (disponíveis: full, {', '.join(_lods(resource))})")
+        v = _get_version(key)
+
+    a = _pick(request, v, resource)
+    if _not_modified(request, a):
+        return _not_modified_response(a)
+    return Response(content=a.body, media_type=RESOURCES[resource][2], headers=a.headers)
+
+def _tileset() -> TileSet:
+    ts = _versions.get(TILES_KEY)
+    if ts is None:
+        if not TILES_MBT.exists():
+            raise HTTPException(status_code=404, detail=f"pirâmide de tiles não encontrada: {TILES_MBT}")
+        ts = _get_version(TILES_KEY)
+    return ts
+
+@app.get("/tiles/{z}/{x}/{y}.mvt")
+def get_tile(z: int, x: int, y: int, request: Request):
+    """
+    Vector tile (MVT) da pirâmide em memória (MBTiles do build): gzip pré-comprimido ou
+    identity, conforme o Accept-Encoding. Tile sem distrito -> 204; ETag por variante.
+    """
+    ts = _tileset()
+    if not (0 <= z <= 30 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="tile fora da grade")
+    v = ts.tiles.get((z, x, y))
+    if v is None:
+        return Response(status_code=204, headers={"Cache-Control": TILE_CACHE_CONTROL})
+    a = _pick(request, v, "tiles")
+    if _not_modified(request, a):
+        return _not_modified_response(a)
+    return Response(content=a.body, media_type=TILE_TYPE, headers=a.headers)
+
+@app.get("/tiles.json")
+def tilejson(request: Request):
+    """TileJSON da pirâmide (zooms, bounds, camadas) para o cliente do mapa."""
+    m = _tileset().meta
+    base = str(request.base_url).rstrip("/")
+    return {
+        "tilejson": "3.0.0",
+        "name": m.get("name"),
+        "scheme": "xyz",
+        "tiles": [base + "/tiles/{z}/{x}/{y}.mvt"],
+        "minzoom": int(m.get("minzoom", 0)),
+        "maxzoom": int(m.get("maxzoom", 14)),
+        "bounds": [float(v) for v in m.get("bounds", "-180,-85,180,85").split(",")],
+        "vector_layers": json.loads(m.get("json", "{}")).get("vector_layers", []),
+    }
+
+@app.get("/stats")
+def stats():
+    """Respostas por rota e codificação escolhida, e as versões em memória."""
+    return {
+        "served": [{"route": r, "encoding": e, "count": n} for (r, e), n in sorted(_served.items())],
+        "versions": {k: (list(v.encodings) if isinstance(v, Variants) else f"{len(v.tiles)} tiles")
+                     for k, v in _versions.items()},
+        "zstd": zstandard is not None,
+    }
 
 @app.post("/geojson/rebuild")
 def rebuild():
     """
-    Força rebuild do cache. Se já houver build em progresso, retorna 202 + Retry-After.
+    Enfileira o rebuild forçado do cache de todos os recursos/LODs (e a troca das versões em memória).
+    Responde 202 na hora com o id do job; o estado fica em GET /geojson/rebuild/{id}.
     """
-    if _locked():
-        # já tem build rolando
-        return Response(
-            status_code=202,
-            headers={"Retry-After": "5"},
-            content="build em andamento, tente novamente em alguns segundos"
-        )
+    job = _submit("rebuild", _all_keys(), force=True)
+    url = f"/geojson/rebuild/{job.id}"
+    return JSONResponse(status_code=202, content={"job": job.id, "status": job.status, "status_url": url},
+                        headers={"Location": url, "Retry-After": "2"})
 
-    got_lock = _acquire_lock()
-    if not got_lock:
-        return Response(
-            status_code=202,
-            headers={"Retry-After": "5"},
-            content="build em andamento, tente novamente em alguns segundos"
-        )
-
-    try:
-        etag = _ensure_cache(build_if_missing=True)
-    finally:
-        _release_lock()
+@app.get("/geojson/rebuild/{job_id}")
+def rebuild_status(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job desconhecido: {job_id}")
+    return job.to_dict()
 
-    return PlainTextResponse(f"ok - etag: {etag}", status_code=200)
+if __name__ == "__main__":
+    # uso pelo pipeline (estágio 'cdn'): python server.py --build-cache
+    import sys
+    if "--build-cache" in sys.argv:
+        with _build_lock():
+            for key in _all_keys():
+                resource, lod = key.split(":", 1)
+                etag = _ensure_cache(build_if_missing=True, lod=lod, resource=resource)
+                print(f"[ok] cache CDN: {_lod_paths(lod, resource)[2]} (etag {etag})")
@@ -0,0 +1,5 @@
+# tests/conftest.py
+# os módulos do pipeline são scripts soltos em sp-bairros/: deixa-os importáveis nos testes
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
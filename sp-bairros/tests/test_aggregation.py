@@ -0,0 +1,71 @@
+# tests/test_aggregation.py
+"""
+Paridade da agregação colunar (aggregation.py) com a implementação original do
+ETL (groupby + apply por grupo), que fica só aqui como referência.
+
+Rodar de sp-bairros/:
+    python -m pytest -q tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import KEYS, add_flags, aggregate_districts
+
+def legacy_aggregate(joined: pd.DataFrame, ideb_df=None) -> pd.DataFrame:
+    """Implementação original (groupby + apply por grupo)."""
+    grp = joined.groupby(KEYS, dropna=False)
+    agg = grp.apply(lambda g: pd.Series({
+        "schools_total": int(g.shape[0]),
+        "schools_municipal": int(g["is_municipal"].sum()),
+        "schools_estadual": int(g["is_estadual"].sum()),
+        "schools_privada": int(g["is_privada"].sum()),
+        "acesso_creche_proxy": (g["is_ei_creche"].mean() if g.shape[0]>0 else np.nan)
+    }), include_groups=False).reset_index()
+
+    if ideb_df is not None and "id_escola" in ideb_df.columns and ideb_df["id_escola"].notna().any():
+        df = joined.merge(ideb_df[["id_escola","ideb","ideb_year"]], on="id_escola", how="left")
+        ideb_agg = df.groupby(KEYS, dropna=False).apply(lambda g: pd.Series({
+            "ideb": np.nanmean(g["ideb"]),
+            "ideb_year": g["ideb_year"].dropna().max() if g["ideb_year"].notna().any() else pd.NA
+        }), include_groups=False).reset_index()
+        agg = agg.merge(ideb_agg, on=KEYS, how="left")
+    else:
+        agg["ideb"] = np.nan
+        agg["ideb_year"] = pd.NA
+    return agg
+
+@pytest.fixture
+def joined():
+    """Escolas já atribuídas a distrito: redes/etapas variadas, categóricas e um distrito sem creche."""
+    df = pd.DataFrame({
+        "id_escola":   ["1", "2", "3", "4", "5", "6", "7", "8"],
+        "bairro_id":   ["10", "10", "10", "20", "20", "30", "30", "30"],
+        "bairro_name": ["Sé", "Sé", "Sé", "Brás", "Brás", "Mooca", "Mooca", "Mooca"],
+        "rede":  ["Municipal", "Estadual", "Privada", "municipal", None, "Estadual", "Privada", "Privada"],
+        "etapa": ["Creche", "Fundamental", "Educação Infantil", "Médio", "Fundamental", "Médio", None, "Médio"],
+    })
+    df["rede"] = df["rede"].astype("category")
+    return add_flags(df)
+
+@pytest.fixture
+def ideb_df():
+    return pd.DataFrame({"id_escola": ["1", "2", "4", "6", "9"],
+                         "ideb": [5.5, 6.1, np.nan, 4.2, 7.0],
+                         "ideb_year": pd.array([2021, 2023, 2019, pd.NA, 2023], dtype="Int64")})
+
+def _compare(new: pd.DataFrame, old: pd.DataFrame):
+    cols = list(old.columns)
+    assert list(new.columns[:len(cols)]) == cols
+    a = new[cols].reset_index(drop=True)
+    b = old.reset_index(drop=True)
+    a["ideb_year"] = pd.to_numeric(a["ideb_year"], errors="coerce")
+    b["ideb_year"] = pd.to_numeric(b["ideb_year"], errors="coerce")
+    pd.testing.assert_frame_equal(a, b, check_dtype=False)
+
+def test_parity_without_ideb(joined):
+    _compare(aggregate_districts(joined), legacy_aggregate(joined))
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")   # distrito sem IDEB: np.nanmean do legado
+def test_parity_with_ideb(joined, ideb_df):
+    _compare(aggregate_districts(joined, ideb_df), legacy_aggregate(joined, ideb_df))